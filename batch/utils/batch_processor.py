@@ -23,11 +23,23 @@ def record_and_update_config(source_language, target_language):
     
     return original_source_lang, original_target_lang
 
+def warm_spacy_models(df):
+    """Preload the spaCy models of the queued tasks' source languages so every task reuses them"""
+    from core.spacy_utils.load_nlp_model import warm_nlp
+    queued = df[df['Status'].isna() | df['Status'].astype(str).str.contains('Error')]
+    languages = {load_key('whisper.language') if pd.isna(language) else language for language in queued['Source Language']}
+    # 'auto' is only known after transcription, those tasks load their model on first use
+    languages.discard('auto')
+    if languages:
+        console.print(f"[cyan]🔥 Preloading spaCy models for: {', '.join(sorted(languages))}[/cyan]")
+        warm_nlp(languages)
+
 def process_batch():
     if not check_settings():
         raise Exception("Settings check failed")
 
     df = pd.read_excel('batch/tasks_setting.xlsx')
+    warm_spacy_models(df)
     for index, row in df.iterrows():
         if pd.isna(row['Status']) or 'Error' in str(row['Status']):
             total_tasks = len(df)
@@ -91,6 +103,12 @@ def process_batch():
         else:
             print(f"Skipping task: {row['Video File']} - Status: {row['Status']}")
 
+    from core.spacy_utils.load_nlp_model import release_nlp
+    release_nlp()
+    if load_key("whisper.runtime") == "local":
+        from core.all_whisper_methods.whisperX_local import release_models
+        release_models()
+
     console.print(Panel("All tasks processed!\nCheck out in `batch/output`!", 
                        title="[bold green]Batch Processing Complete", expand=False))
 
@@ -3,6 +3,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from st_components.imports_and_utils import *
 from core.onekeycleanup import cleanup
 from core.config_utils import load_key
+from core.llm_scheduler import report_usage
 import shutil
 from functools import partial
 from rich.panel import Panel
@@ -60,6 +61,7 @@ def process_video(file, dubbing=False, is_retry=False):
                         border_style="red"
                     )
                     console.print(error_panel)
+                    report_usage(reset=True)
                     cleanup(ERROR_OUTPUT_DIR)
                     return False, current_step, str(e)
                 console.print(Panel(
@@ -67,6 +69,7 @@ def process_video(file, dubbing=False, is_retry=False):
                     border_style="yellow"
                 ))
     
+    report_usage(reset=True)
     console.print(Panel("[bold green]All steps completed successfully! 🎉[/]", border_style="green"))
     cleanup(SAVE_DIR)
     return True, "", ""
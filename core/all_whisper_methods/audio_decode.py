@@ -0,0 +1,117 @@
+import os, sys, io, json
+import gc
+import subprocess
+import threading
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from rich import print as rprint
+
+"""
+ASR 音频解码层：
+    把转录用音频一次性解码为 16kHz float32 单声道 PCM，落盘后以 memmap 方式打开。
+    按 (start, end) 返回零拷贝切片，不再为每个片段调用 ffmpeg、写临时 WAV、再用 librosa 重采样。
+    人声增益等处理在解码时通过 ffmpeg 滤镜完成，不再额外编码中间 mp3。
+    长视频也只占用切片大小的内存。
+"""
+
+SAMPLE_RATE = 16000
+PCM_FILE = "output/audio/for_whisper.f32"
+
+_BUFFERS = {}
+_LOCK = threading.Lock()
+
+class AudioBuffer:
+    """Read-only float32 PCM on disk, sliced without copying"""
+    def __init__(self, pcm_file: str, sample_rate: int = SAMPLE_RATE, audio_filter: str = None):
+        self.pcm_file = pcm_file
+        self.sample_rate = sample_rate
+        self.audio_filter = audio_filter
+        self.data = np.memmap(pcm_file, dtype=np.float32, mode='r') if os.path.getsize(pcm_file) else np.zeros(0, dtype=np.float32)
+
+    @property
+    def duration(self) -> float:
+        return len(self.data) / self.sample_rate
+
+    def close(self):
+        """Drop this buffer's reference to the memmap; the mapping is unmapped once no slice of it is alive either"""
+        self.data = np.zeros(0, dtype=np.float32)
+
+    def slice(self, start: float, end: float = None) -> np.ndarray:
+        begin = max(0, int(round(start * self.sample_rate)))
+        stop = len(self.data) if end is None else min(len(self.data), int(round(end * self.sample_rate)))
+        return self.data[begin:stop]
+
+def _source_stamp(audio_file: str) -> dict:
+    stat = os.stat(audio_file)
+    return {"source": os.path.abspath(audio_file), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+def write_pcm_meta(audio_file: str, pcm_file: str = PCM_FILE, sample_rate: int = SAMPLE_RATE, audio_filter: str = None):
+    """Record which source `pcm_file` was decoded from, for PCM written by another ffmpeg pass"""
+    with open(pcm_file + '.json', 'w', encoding='utf-8') as f:
+        json.dump({**_source_stamp(audio_file), "sample_rate": sample_rate, "filter": audio_filter}, f)
+
+def _pcm_is_current(audio_file: str, pcm_file: str, sample_rate: int, audio_filter: str) -> bool:
+    meta_file = pcm_file + '.json'
+    if not (os.path.exists(pcm_file) and os.path.exists(meta_file)):
+        return False
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    # readers that don't pass a filter take the PCM as the producer decoded it
+    if audio_filter is not None and meta.get("filter") != audio_filter:
+        return False
+    return {k: meta.get(k) for k in ("source", "size", "mtime", "sample_rate")} == {**_source_stamp(audio_file), "sample_rate": sample_rate}
+
+def decode_to_pcm(audio_file: str, pcm_file: str = PCM_FILE, sample_rate: int = SAMPLE_RATE, audio_filter: str = None) -> str:
+    """Decode the whole file once with ffmpeg into raw float32 mono, skipped while the source is unchanged"""
+    if _pcm_is_current(audio_file, pcm_file, sample_rate, audio_filter):
+        return pcm_file
+
+    rprint(f"[cyan]🎧 Decoding <{audio_file}> to {sample_rate}Hz PCM ...[/cyan]")
+    os.makedirs(os.path.dirname(pcm_file) or '.', exist_ok=True)
+    tmp_file = pcm_file + '.tmp'
+    subprocess.run([
+        'ffmpeg', '-y', '-i', audio_file, '-vn', *(['-af', audio_filter] if audio_filter else []),
+        '-ac', '1', '-ar', str(sample_rate), '-f', 'f32le', '-acodec', 'pcm_f32le', tmp_file
+    ], check=True, stderr=subprocess.PIPE)
+    os.replace(tmp_file, pcm_file)
+    write_pcm_meta(audio_file, pcm_file, sample_rate, audio_filter)
+    return pcm_file
+
+def load_audio_buffer(audio_file: str, pcm_file: str = PCM_FILE, audio_filter: str = None) -> AudioBuffer:
+    """Decoded buffer for `audio_file`, shared by every caller in the process; `audio_filter` is an ffmpeg -af chain"""
+    with _LOCK:
+        key = (os.path.abspath(audio_file), os.path.abspath(pcm_file))
+        buffer = _BUFFERS.get(key)
+        if buffer is None or not os.path.exists(buffer.pcm_file) or (audio_filter is not None and buffer.audio_filter != audio_filter):
+            buffer = AudioBuffer(decode_to_pcm(audio_file, pcm_file, audio_filter=audio_filter), audio_filter=audio_filter)
+            _BUFFERS[key] = buffer
+        return buffer
+
+def release_audio_buffers(remove_files: bool = False):
+    """Close all buffers, optionally deleting the decoded PCM files"""
+    with _LOCK:
+        buffers = list(_BUFFERS.values())
+        _BUFFERS.clear()
+    pcm_files = {buffer.pcm_file for buffer in buffers}
+    for buffer in buffers:
+        buffer.close()
+    del buffers
+    # unmap memmaps nobody holds any more, Windows refuses to delete a file that is still mapped
+    gc.collect()
+    if remove_files:
+        for pcm_file in pcm_files:
+            for path in (pcm_file, pcm_file + '.json'):
+                if not os.path.exists(path):
+                    continue
+                try:
+                    os.remove(path)
+                except PermissionError:
+                    rprint(f"[yellow]⚠️ {path} is still mapped by a live audio slice, leaving it in place[/yellow]")
+
+def encode_wav_bytes(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> io.BytesIO:
+    """16-bit WAV of `samples` in memory, for uploads"""
+    import soundfile as sf
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format='WAV', subtype='PCM_16')
+    buffer.seek(0)
+    return buffer
@@ -1,16 +1,21 @@
-import os, sys, subprocess
+import os, sys, json, subprocess
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple, Union
 from rich import print
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from core.config_utils import update_key
+from core.config_utils import load_key, update_key
+from core.all_whisper_methods.audio_decode import load_audio_buffer, write_pcm_meta, SAMPLE_RATE
+from core.artifact_cache import cached_artifact
+from core.intermediate_store import save_table, table_file
+from core.transcript_index import TranscriptIndex
 
 
 """
 核心功能：
-    ffmpeg 处理音频（压缩、转码、检测静音）。
-    计算音频时长，自动 按静音点切割。
-    处理 Whisper 转录结果，清理长单词、符号。
+    ffmpeg 一次解码提取音频（转码、检测静音），结果按输入内容哈希缓存，跨任务复用。
+    计算音频时长，自动 按静音点切割，跳过长段无人声区域（VAD 门控）。
+    处理 Whisper 转录结果，按列构建单词表，清理长单词、符号。
 
 主要用于自动化音频处理和语音识别，适合长音频的拆分和转录。
 """
@@ -18,48 +23,122 @@ from core.config_utils import update_key
 
 AUDIO_DIR = "output/audio"
 RAW_AUDIO_FILE = "output/audio/raw.mp3"
-CLEANED_CHUNKS_EXCEL_PATH = "output/log/cleaned_chunks.xlsx"
-
-def compress_audio(input_file: str, output_file: str):
-    """将输入音频文件压缩为低质量音频文件，用于转录"""
-    if not os.path.exists(output_file):
-        print(f"🗜️ Converting to low quality audio with FFmpeg ......")
-        # 16000 Hz, 1 channel, (Whisper default) , 96kbps to keep more details as well as smaller file size
-        subprocess.run([
-            'ffmpeg', '-y', '-i', input_file, '-vn', '-b:a', '96k',
-            '-ar', '16000', '-ac', '1', '-metadata', 'encoding=UTF-8',
-            '-f', 'mp3', output_file
-        ], check=True, stderr=subprocess.PIPE)
-        print(f"🗜️ Converted <{input_file}> to <{output_file}> with FFmpeg")
-    return output_file
-
-def convert_video_to_audio(video_file: str):
-    """提取视频中的音频，并保存为 raw.mp3"""
+SILENCE_MAP_FILE = "output/log/silence_map.json"
+
+SILENCE_DB = -30  # same threshold the old `silencedetect=n=-30dB` used
+MIN_SILENCE = 0.5  # seconds
+FRAME_SEC = 0.02  # RMS frame length
+BLOCK_FRAMES = 30000  # frames per block (10 min) so the energy pass never copies the whole signal
+
+def convert_video_to_audio(video_file: str, pcm_file: str = None):
+    """
+    提取视频中的音频，并保存为 raw.mp3。
+    传入 pcm_file 时在同一次解码中用 asplit 同时输出转录用的 16kHz PCM，不再从 raw.mp3 二次解码。
+    """
     os.makedirs(AUDIO_DIR, exist_ok=True)
     if not os.path.exists(RAW_AUDIO_FILE):
-        print(f"🎬➡️🎵 Converting to high quality audio with FFmpeg ......")
-        subprocess.run([
-            'ffmpeg', '-y', '-i', video_file, '-vn',
-            '-c:a', 'libmp3lame', '-b:a', '128k',
-            '-ar', '32000',
-            '-ac', '1', 
-            '-metadata', 'encoding=UTF-8', RAW_AUDIO_FILE
-        ], check=True, stderr=subprocess.PIPE)
-        print(f"🎬➡️🎵 Converted <{video_file}> to <{RAW_AUDIO_FILE}> with FFmpeg\n")
-
-def _detect_silence(audio_file: str, start: float, end: float) -> List[float]:
-    """检测音频中的静音点(Detect silence points in the given audio segment)"""
-    cmd = ['ffmpeg', '-y', '-i', audio_file, 
-           '-ss', str(start), '-to', str(end),
-           '-af', 'silencedetect=n=-30dB:d=0.5', 
-           '-f', 'null', '-']
-    
-    output = subprocess.run(cmd, capture_output=True, text=True, 
-                          encoding='utf-8').stderr
-    
-    return [float(line.split('silence_end: ')[1].split(' ')[0])
-            for line in output.split('\n')
-            if 'silence_end' in line]
+        cmd = ['-c:a', 'libmp3lame', '-b:a', '128k', '-ar', '32000', '-ac', '1', '-metadata', 'encoding=UTF-8']
+        def produce():
+            print(f"🎬➡️🎵 Converting to high quality audio with FFmpeg ......")
+            if pcm_file is None:
+                subprocess.run(['ffmpeg', '-y', '-i', video_file, '-vn', *cmd, RAW_AUDIO_FILE], check=True, stderr=subprocess.PIPE)
+            else:
+                tmp_file = pcm_file + '.tmp'
+                subprocess.run([
+                    'ffmpeg', '-y', '-i', video_file, '-filter_complex', '[0:a:0]asplit=2[raw][asr]',
+                    '-map', '[raw]', *cmd, RAW_AUDIO_FILE,
+                    '-map', '[asr]', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 'f32le', '-c:a', 'pcm_f32le', tmp_file
+                ], check=True, stderr=subprocess.PIPE)
+                os.replace(tmp_file, pcm_file)
+            print(f"🎬➡️🎵 Converted <{video_file}> to <{RAW_AUDIO_FILE}> with FFmpeg\n")
+        hit = cached_artifact("raw_audio", [video_file], {"ffmpeg": cmd}, [RAW_AUDIO_FILE], produce)
+        # on a cache hit the PCM is decoded from raw.mp3 when first needed
+        if pcm_file is not None and not hit:
+            write_pcm_meta(RAW_AUDIO_FILE, pcm_file)
+
+def frame_energy_db(samples: np.ndarray, sample_rate: int, frame_sec: float = FRAME_SEC) -> np.ndarray:
+    """RMS level in dB for consecutive frames, computed block by block"""
+    hop = max(1, int(sample_rate * frame_sec))
+    n_frames = len(samples) // hop
+    levels = np.empty(n_frames, dtype=np.float32)
+    for first in range(0, n_frames, BLOCK_FRAMES):
+        last = min(n_frames, first + BLOCK_FRAMES)
+        block = np.asarray(samples[first * hop:last * hop], dtype=np.float32).reshape(-1, hop)
+        rms = np.sqrt(np.mean(np.square(block), axis=1))
+        levels[first:last] = 20 * np.log10(rms + 1e-10)
+    return levels
+
+def detect_silences(samples: np.ndarray, sample_rate: int, threshold_db: float = SILENCE_DB,
+                    min_duration: float = MIN_SILENCE, frame_sec: float = FRAME_SEC) -> List[Tuple[float, float]]:
+    """所有静音区间 (start, end)，一次遍历整段信号 (All silent spans over the whole signal in one pass)"""
+    silent = frame_energy_db(samples, sample_rate, frame_sec) < threshold_db
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    keep = (ends - starts) * frame_sec >= min_duration
+    return [(float(s * frame_sec), float(e * frame_sec)) for s, e in zip(starts[keep], ends[keep])]
+
+def get_silence_map(audio_file: str) -> Dict:
+    """Duration and silent spans of the audio, computed once and saved to output/log for later stages"""
+    stat = os.stat(audio_file)
+    source = {"source": os.path.abspath(audio_file), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if os.path.exists(SILENCE_MAP_FILE):
+        with open(SILENCE_MAP_FILE, 'r', encoding='utf-8') as f:
+            silence_map = json.load(f)
+        if silence_map.get("source_info") == source:
+            return silence_map
+
+    buffer = load_audio_buffer(audio_file)
+    silence_map = {
+        "source_info": source,
+        "duration": buffer.duration,
+        "silences": detect_silences(buffer.data, buffer.sample_rate),
+    }
+    os.makedirs(os.path.dirname(SILENCE_MAP_FILE), exist_ok=True)
+    with open(SILENCE_MAP_FILE, 'w', encoding='utf-8') as f:
+        json.dump(silence_map, f)
+    return silence_map
+
+def load_silence_map() -> Dict:
+    """Silence map saved during transcription, or None"""
+    if not os.path.exists(SILENCE_MAP_FILE):
+        return None
+    with open(SILENCE_MAP_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def choose_split_points(duration: float, silences: List[Tuple[float, float]], target_len: float, win: float) -> List[Tuple[float, float]]:
+    """Segments of about target_len, each cut in the middle of the longest silence within ±win of its target"""
+    segments = []
+    pos = 0
+    while duration - pos > target_len:
+        target = pos + target_len
+        candidates = [(e - s, -abs((s + e) / 2 - target), (s + e) / 2) for s, e in silences
+                      if pos < (s + e) / 2 and abs((s + e) / 2 - target) <= win]
+        # no silence nearby: cut at the target, inside speech
+        split_at = max(candidates)[2] if candidates else target
+        segments.append((pos, split_at))
+        pos = split_at
+    segments.append((pos, duration))
+    return segments
+
+def speech_islands(duration: float, silences: List[Tuple[float, float]], min_skip: float, margin: float) -> List[Tuple[float, float]]:
+    """Spans between silences longer than min_skip, each padded by margin and merged when the padding overlaps"""
+    islands = []
+    speech_start = 0.0
+    for start, end in silences:
+        if end - start < min_skip:
+            continue
+        if start > speech_start:
+            islands.append((max(0.0, speech_start - margin), min(duration, start + margin)))
+        speech_start = end
+    if speech_start < duration:
+        islands.append((max(0.0, speech_start - margin), duration))
+    merged = []
+    for start, end in islands:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
 
 def get_audio_duration(audio_file: str) -> float:
     """Get the duration of an audio file using ffmpeg."""
@@ -79,98 +158,95 @@ def get_audio_duration(audio_file: str) -> float:
 
 def split_audio(audio_file: str, target_len: int = 30*60, win: int = 60) -> List[Tuple[float, float]]:
     # 30 min 16000 Hz 96kbps ~ 22MB < 25MB required by whisper
-    # 将音频切割为多个小片段
+    # 将音频切割为多个小片段，shorter target_len gives more segments for parallel ASR
     print("[bold blue]🔪 Starting audio segmentation...[/]")
     
-    duration = get_audio_duration(audio_file)
-    
+    silence_map = get_silence_map(audio_file)
+    duration, silences = silence_map["duration"], silence_map["silences"]
+    vad_set = load_key("vad_gate")
+    if not vad_set["enabled"]:
+        segments = choose_split_points(duration, silences, target_len, win)
+        print(f"🔪 Audio split into {len(segments)} segments")
+        return segments
+
+    # VAD gate: only speech islands go to ASR, segments keep absolute offsets so timestamps land on the original timeline
+    islands = speech_islands(duration, silences, vad_set["min_skip"], vad_set["margin"])
+    if not islands:
+        raise ValueError(f"No speech found above {SILENCE_DB}dB in {audio_file}, "
+                         "the audio may be too quiet for the VAD gate. Set `vad_gate.enabled` to false and retry.")
     segments = []
-    pos = 0
-    while pos < duration:
-        if duration - pos < target_len:
-            segments.append((pos, duration))
-            break
-        win_start = pos + target_len - win
-        win_end = min(win_start + 2 * win, duration)
-        silences = _detect_silence(audio_file, win_start, win_end)
-    
-        if silences:
-            target_pos = target_len - (win_start - pos)
-            split_at = next((t for t in silences if t - win_start > target_pos), None)
-            if split_at:
-                segments.append((pos, split_at))
-                pos = split_at
-                continue
-        segments.append((pos, pos + target_len))
-        pos += target_len
-    
-    print(f"🔪 Audio split into {len(segments)} segments")
+    for island_start, island_end in islands:
+        inner = [(s - island_start, e - island_start) for s, e in silences if s >= island_start and e <= island_end]
+        segments.extend((island_start + s, island_start + e)
+                        for s, e in choose_split_points(island_end - island_start, inner, target_len, win))
+    kept = sum(end - start for start, end in segments)
+    skipped = duration - kept
+    print(f"🔪 Audio split into {len(segments)} segments, "
+          f"🔇 skipped {skipped:.0f}s of {duration:.0f}s non-speech ({skipped / duration:.1%})")
     return segments
 
-def process_transcription(result: Dict) -> pd.DataFrame:
-    all_words = []
-    for segment in result['segments']:
-        for word in segment['words']:
-            # Check word length
-            if len(word["word"]) > 20:
-                print(f"⚠️ Warning: Detected word longer than 20 characters, skipping: {word['word']}")
-                continue
-                
-            # ! For French, we need to convert guillemets to empty strings
-            word["word"] = word["word"].replace('»', '').replace('«', '')
-            
-            if 'start' not in word and 'end' not in word:
-                if all_words:
-                    # Assign the end time of the previous word as the start and end time of the current word
-                    word_dict = {
-                        'text': word["word"],
-                        'start': all_words[-1]['end'],
-                        'end': all_words[-1]['end'],
-                    }
-                    all_words.append(word_dict)
-                else:
-                    # If it's the first word, look next for a timestamp then assign it to the current word
-                    next_word = next((w for w in segment['words'] if 'start' in w and 'end' in w), None)
-                    if next_word:
-                        word_dict = {
-                            'text': word["word"],
-                            'start': next_word["start"],
-                            'end': next_word["end"],
-                        }
-                        all_words.append(word_dict)
-                    else:
-                        raise Exception(f"No next word with timestamp found for the current word : {word}")
-            else:
-                # Normal case, with start and end times
-                word_dict = {
-                    'text': f'{word["word"]}',
-                    'start': word.get('start', all_words[-1]['end'] if all_words else 0),
-                    'end': word['end'],
-                }
-                
-                all_words.append(word_dict)
-    
-    return pd.DataFrame(all_words)
+MAX_WORD_LEN = 20  # longer "words" are whisper hallucinations
+
+def process_transcription(results: Union[Dict, Iterable[Dict]]) -> pd.DataFrame:
+    """
+    Build the word table (text, start, end, segment_id, confidence) from one whisper result or an iterable of
+    per-segment results, consumed as they arrive. Words are flattened into columns, missing timestamps are filled vectorized.
+    """
+    if isinstance(results, dict):
+        results = [results]
+    texts, starts, ends, segment_ids, scores = [], [], [], [], []
+    segment_id = 0
+    for segment in (segment for result in results for segment in result['segments']):
+        words = segment['words']
+        texts.extend(word['word'] for word in words)
+        starts.extend(word.get('start', np.nan) for word in words)
+        ends.extend(word.get('end', np.nan) for word in words)
+        scores.extend(word.get('score', np.nan) for word in words)
+        segment_ids.extend([segment_id] * len(words))
+        segment_id += 1
+
+    df = pd.DataFrame({
+        'text': pd.Series(texts, dtype=object),
+        'start': np.asarray(starts, dtype=np.float64),
+        'end': np.asarray(ends, dtype=np.float64),
+        'segment_id': np.asarray(segment_ids, dtype=np.int64),
+        'confidence': np.asarray(scores, dtype=np.float64),
+    })
+    too_long = df['text'].str.len() > MAX_WORD_LEN
+    for word in df.loc[too_long, 'text']:
+        print(f"⚠️ Warning: Detected word longer than {MAX_WORD_LEN} characters, skipping: {word}")
+    df = df[~too_long].reset_index(drop=True)
+    # ! For French, we need to convert guillemets to empty strings
+    df['text'] = df['text'].str.replace('»', '', regex=False).str.replace('«', '', regex=False)
+
+    # Words without timestamps take the end of the previous word; leading ones take the next timestamped word
+    raw_start, raw_end = df['start'], df['end']
+    both_missing = raw_start.isna() & raw_end.isna()
+    prev_end = raw_end.ffill().shift(1)
+    start = raw_start.fillna(prev_end)
+    end = raw_end.where(~both_missing, prev_end)
+    start[start.isna() & ~both_missing] = 0
+    df['start'] = start.fillna(raw_start.bfill())
+    df['end'] = end.fillna(raw_end.bfill())
+    if df['start'].isna().any() or df['end'].isna().any():
+        raise Exception(f"No word with timestamp found for: {df.loc[df['start'].isna(), 'text'].tolist()}")
+    return df
 
 def save_results(df: pd.DataFrame):
     os.makedirs('output/log', exist_ok=True)
 
-    # Remove rows where 'text' is empty
-    initial_rows = len(df)
-    df = df[df['text'].str.len() > 0]
-    removed_rows = initial_rows - len(df)
-    if removed_rows > 0:
-        print(f"ℹ️ Removed {removed_rows} row(s) with empty text.")
-    
-    # Check for and remove words longer than 20 characters
-    long_words = df[df['text'].str.len() > 20]
-    if not long_words.empty:
-        print(f"⚠️ Warning: Detected {len(long_words)} word(s) longer than 20 characters. These will be removed.")
-        df = df[df['text'].str.len() <= 20]
+    # Remove rows where 'text' is empty or longer than MAX_WORD_LEN
+    lengths = df['text'].str.len()
+    empty, long_words = lengths == 0, lengths > MAX_WORD_LEN
+    if empty.any():
+        print(f"ℹ️ Removed {int(empty.sum())} row(s) with empty text.")
+    if long_words.any():
+        print(f"⚠️ Warning: Detected {int(long_words.sum())} word(s) longer than {MAX_WORD_LEN} characters. These will be removed.")
+    df = df[~(empty | long_words)]
     
-    df['text'] = df['text'].apply(lambda x: f'"{x}"')
-    df.to_excel(CLEANED_CHUNKS_EXCEL_PATH, index=False)
-    print(f"📊 Excel file saved to {CLEANED_CHUNKS_EXCEL_PATH}")
+    save_table('cleaned_chunks', df)
+    TranscriptIndex.from_words(df).save()
+    print(f"📊 Word table saved to {table_file('cleaned_chunks')}")
 
 def save_language(language: str):
     update_key("whisper.detected_language", language)
\ No newline at end of file
@@ -9,7 +9,14 @@ from torch.cuda import is_available as is_cuda_available
 from typing import Optional
 from demucs.api import Separator
 from demucs.apply import BagOfModels
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import numpy as np
+import soundfile as sf
+import subprocess
 import gc
+from core.config_utils import load_key
+from core.artifact_cache import cached_artifact
 
 """
 使用 Demucs（一个基于深度学习的音频分离模型）将音频文件 分离为人声（vocal）和背景音乐（background）
@@ -23,6 +30,7 @@ AUDIO_DIR = "output/audio"
 RAW_AUDIO_FILE = os.path.join(AUDIO_DIR, "raw.mp3") #  原始音频文件路径（待处理）
 BACKGROUND_AUDIO_FILE = os.path.join(AUDIO_DIR, "background.mp3") #  背景音乐文件路径（处理后）
 VOCAL_AUDIO_FILE = os.path.join(AUDIO_DIR, "vocal.mp3") #  人声文件路径（处理后）
+STREAM_INPUT_FILE = os.path.join(AUDIO_DIR, "demucs_input.f32") #  流式分离时解码后的输入 PCM
 
 class PreloadedSeparator(Separator):
     """
@@ -40,17 +48,131 @@ class PreloadedSeparator(Separator):
         self.update_parameter(device=device, shifts=shifts, overlap=overlap, split=split,
                             segment=segment, jobs=jobs, progress=True, callback=None, callback_arg=None)
 
+    def separate_window(self, window: np.ndarray):
+        """Separate one (samples, channels) window, return (vocals, background) as (samples, channels) arrays"""
+        _, outputs = self.separate_tensor(torch.from_numpy(np.ascontiguousarray(window.T)), self._samplerate)
+        vocals = outputs['vocals'].cpu().numpy().T
+        background = sum(audio for source, audio in outputs.items() if source != 'vocals').cpu().numpy().T
+        return vocals, background
+
+_WORKER_SEPARATOR = None
+
+def _init_worker(threads: int):
+    global _WORKER_SEPARATOR
+    torch.set_num_threads(threads)
+    _WORKER_SEPARATOR = PreloadedSeparator(model=get_model('htdemucs'), shifts=1, overlap=0.25)
+    _WORKER_SEPARATOR.update_parameter(progress=False)
+
+def _separate_in_worker(window: np.ndarray):
+    return _WORKER_SEPARATOR.separate_window(window)
+
+def _decode_stereo(input_file: str, samplerate: int, channels: int) -> np.ndarray:
+    """Decode to float32 PCM on disk and memory-map it as (samples, channels)"""
+    subprocess.run(['ffmpeg', '-y', '-i', input_file, '-vn', '-ac', str(channels), '-ar', str(samplerate),
+                    '-f', 'f32le', '-acodec', 'pcm_f32le', STREAM_INPUT_FILE], check=True, stderr=subprocess.PIPE)
+    return np.memmap(STREAM_INPUT_FILE, dtype=np.float32, mode='r').reshape(-1, channels)
+
+def _encode_mp3(wav_file: str, mp3_file: str):
+    subprocess.run(['ffmpeg', '-y', '-i', wav_file, '-b:a', '64k', mp3_file], check=True, stderr=subprocess.PIPE)
+    os.remove(wav_file)
+
+def separate_streaming(model: BagOfModels, input_file: str, window_sec: float, overlap_sec: float,
+                       max_windows: int, workers: int):
+    """
+    Separate fixed windows and overlap-add them with a linear crossfade, writing vocals/background as they finish.
+    With `workers` > 1 at most `max_windows` windows are in flight across the processes, otherwise one window at a time.
+    """
+    if window_sec <= 0 or not 0 <= overlap_sec < window_sec:
+        raise ValueError(f"❌ Invalid demucs_stream config: need window > 0 and 0 <= overlap < window, "
+                         f"got window={window_sec}, overlap={overlap_sec}")
+    console = Console()
+    samplerate, channels = model.samplerate, model.audio_channels
+    audio = _decode_stereo(input_file, samplerate, channels)
+    window, overlap = int(window_sec * samplerate), int(overlap_sec * samplerate)
+    hop = window - overlap
+    starts = list(range(0, max(1, len(audio) - overlap), hop))
+    fade_in = np.linspace(0, 1, overlap, dtype=np.float32)[:, None]
+
+    separator = None
+    pool = None
+    if workers > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        console.print(f"🧵 Separating with {workers} worker processes x {threads} threads")
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,))
+    else:
+        separator = PreloadedSeparator(model=model, shifts=1, overlap=0.25)
+        separator.update_parameter(progress=False)
+
+    vocal_wav, background_wav = VOCAL_AUDIO_FILE + '.wav', BACKGROUND_AUDIO_FILE + '.wav'
+    tail = None
+    try:
+        with sf.SoundFile(vocal_wav, 'w', samplerate, channels, subtype='PCM_16') as vocal_out, \
+             sf.SoundFile(background_wav, 'w', samplerate, channels, subtype='PCM_16') as background_out:
+            pending = deque()
+            next_window = 0
+            for index in range(len(starts)):
+                if pool:
+                    # keep up to max_windows windows in flight across the workers
+                    while next_window < len(starts) and len(pending) < max(1, max_windows):
+                        chunk = np.array(audio[starts[next_window]:starts[next_window] + window])
+                        pending.append(pool.submit(_separate_in_worker, chunk))
+                        next_window += 1
+                    vocals, background = pending.popleft().result()
+                else:
+                    # in-process: copy only the window being separated
+                    chunk = np.array(audio[starts[index]:starts[index] + window])
+                    vocals, background = separator.separate_window(chunk)
+                    del chunk
+
+                if tail is not None:
+                    n = min(overlap, len(vocals), len(tail[0]))
+                    vocals[:n] = tail[0][:n] * (1 - fade_in[:n]) + vocals[:n] * fade_in[:n]
+                    background[:n] = tail[1][:n] * (1 - fade_in[:n]) + background[:n] * fade_in[:n]
+                is_last = index == len(starts) - 1
+                keep = len(vocals) if is_last else max(0, len(vocals) - overlap)
+                vocal_out.write(np.clip(vocals[:keep], -1, 1))
+                background_out.write(np.clip(background[:keep], -1, 1))
+                tail = (vocals[keep:], background[keep:])
+                console.print(f"🎵 Separated window {index + 1}/{len(starts)}")
+    finally:
+        if pool:
+            pool.shutdown()
+        del audio
+        if os.path.exists(STREAM_INPUT_FILE):
+            os.remove(STREAM_INPUT_FILE)
+
+    console.print("🎤 Encoding vocals and background tracks...")
+    _encode_mp3(vocal_wav, VOCAL_AUDIO_FILE)
+    _encode_mp3(background_wav, BACKGROUND_AUDIO_FILE)
+
 def demucs_main():
     if os.path.exists(VOCAL_AUDIO_FILE) and os.path.exists(BACKGROUND_AUDIO_FILE):
         rprint(f"[yellow]⚠️ {VOCAL_AUDIO_FILE} and {BACKGROUND_AUDIO_FILE} already exist, skip Demucs processing.[/yellow]")
         return
-    
+    # 同一份 raw.mp3 用同样的参数分离过，就直接从缓存取出人声和背景音
+    params = {"model": "htdemucs", "bitrate": 64, "stream": load_key("demucs_stream")}
+    cached_artifact("demucs", [RAW_AUDIO_FILE], params, [VOCAL_AUDIO_FILE, BACKGROUND_AUDIO_FILE], separate_main)
+
+def separate_main():
     # 加载模型并执行音频分离
     console = Console()
     os.makedirs(AUDIO_DIR, exist_ok=True)
     
     console.print("🤖 Loading <htdemucs> model...")
     model = get_model('htdemucs')
+
+    stream_set = load_key("demucs_stream")
+    if stream_set["enabled"]:
+        # 流式分离：按窗口处理，峰值内存与音频总长度无关
+        workers = stream_set["workers"] if not (is_cuda_available() or torch.backends.mps.is_available()) else 1
+        console.print("🎵 Separating audio in streaming windows...")
+        separate_streaming(model, RAW_AUDIO_FILE, stream_set["window"], stream_set["overlap"],
+                           stream_set["max_windows"], workers)
+        del model
+        gc.collect()
+        console.print("[green]✨ Audio separation completed![/green]")
+        return
+
     separator = PreloadedSeparator(model=model, shifts=1, overlap=0.25)
     
     # 通过 Demucs 模型分离音频，outputs 是一个字典，包含：outputs["vocals"]：人声; outputs["bass"], outputs["drums"], outputs["other"]（背景音）
@@ -2,83 +2,119 @@ import requests
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from core.config_utils import load_key
+from core.llm_scheduler import backoff_delay
 from rich import print as rprint
 import time
 import json
-import tempfile
-import subprocess
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from core.all_whisper_methods.audio_decode import load_audio_buffer, encode_wav_bytes
 
 """
 WhisperX 是 Whisper 的加速版，提供更快的识别和对齐能力。
+    复用同一个 requests.Session，按配置的并发数同时上传多个片段。
+    结果按片段内容哈希 + 起始偏移缓存，失败的片段单独重试。
 """
 
 OUTPUT_LOG_DIR = "output/log"
-def transcribe_audio_302(audio_path: str, start: float = None, end: float = None):
-    os.makedirs(OUTPUT_LOG_DIR, exist_ok=True)
-    LOG_FILE = f"{OUTPUT_LOG_DIR}/whisperx302.json"
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-        
-    WHISPER_LANGUAGE = load_key("whisper.language")
-    url = "https://api.302.ai/302/whisperx"
-    
-    # 如果指定了开始和结束时间，创建临时音频片段
-    if start is not None and end is not None:
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
-            temp_audio_path = temp_audio.name
-            
-        # 使用ffmpeg截取音频片段
-        ffmpeg_cmd = f'ffmpeg -y -i "{audio_path}" -ss {start} -t {end-start} -vn -ar 32000 -ac 1 "{temp_audio_path}"'
-        subprocess.run(ffmpeg_cmd, shell=True, check=True, capture_output=True)
-        audio_path = temp_audio_path
-    
+CACHE_DIR = os.path.join(OUTPUT_LOG_DIR, "whisperx302")
+API_URL = "https://api.302.ai/302/whisperx"
+MAX_RETRIES = 3
+REQUEST_TIMEOUT = 600
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """One pooled session for every upload in the process"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            pool_size = max(1, load_key("whisperX_302_concurrency"))
+            _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        return _session
+
+def _segment_key(samples, start: float, language: str) -> str:
+    sha = hashlib.sha256(samples.tobytes())
+    sha.update(f"{start:.3f}:{language}".encode())
+    return sha.hexdigest()
+
+def _shift_timestamps(result: dict, start: float) -> dict:
+    for segment in result['segments']:
+        segment['start'] += start
+        segment['end'] += start
+        for word in segment.get('words', []):
+            if 'start' in word:
+                word['start'] += start
+            if 'end' in word:
+                word['end'] += start
+    return result
+
+def _upload(audio_bytes, name: str, language: str) -> dict:
     payload = {
         "processing_type": "align",
-        "language": WHISPER_LANGUAGE,
+        "language": language,
         "output": "raw"
     }
-    
-    start_time = time.time()
-    rprint(f"[cyan]🎤 Transcribing audio with language:  <{WHISPER_LANGUAGE}> ...[/cyan]")
-    files = [
-        ('audio_input',(
-            os.path.basename(audio_path),
-            open(audio_path, 'rb'),
-            'application/octet-stream'
-        ))
-    ]
-    
+    files = [('audio_input', (name, audio_bytes, 'application/octet-stream'))]
     headers = {
         'Authorization': f'Bearer {load_key("whisper.whisperX_302_api_key")}'
     }
+    response = get_session().post(API_URL, headers=headers, data=payload, files=files, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+    if 'segments' not in result:
+        raise ValueError(f"Unexpected 302 WhisperX response: {str(result)[:200]}")
+    return result
 
-    response = requests.request("POST", url, headers=headers, data=payload, files=files)
-    
-    # 清理临时文件
-    if start is not None and end is not None:
-        if os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
+def transcribe_audio_302(audio_path: str, start: float = None, end: float = None):
+    WHISPER_LANGUAGE = load_key("whisper.language")
+    start = start or 0
     
-    with open(LOG_FILE, "w", encoding="utf-8") as f:
-        json.dump(response.json(), f, indent=4, ensure_ascii=False)
-        
-    # 调整时间戳
-    if start is not None:
-        result = response.json()
-        for segment in result['segments']:
-            segment['start'] += start
-            segment['end'] += start
-            for word in segment.get('words', []):
-                if 'start' in word:
-                    word['start'] += start
-                if 'end' in word:
-                    word['end'] += start
-        response._content = json.dumps(result).encode()
+    # 从解码缓存中切出片段，在内存中编码为 WAV 上传
+    buffer = load_audio_buffer(audio_path)
+    samples = buffer.slice(start, end)
+    cache_file = os.path.join(CACHE_DIR, f"{_segment_key(samples, start, WHISPER_LANGUAGE)}.json")
+    if os.path.exists(cache_file):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return _shift_timestamps(json.load(f), start)
+
+    start_time = time.time()
+    rprint(f"[cyan]🎤 Transcribing segment {start:.2f}s with language:  <{WHISPER_LANGUAGE}> ...[/cyan]")
+    name = os.path.splitext(os.path.basename(audio_path))[0] + '.wav'
+    for attempt in range(MAX_RETRIES):
+        try:
+            result = _upload(encode_wav_bytes(samples, buffer.sample_rate), name, WHISPER_LANGUAGE)
+            break
+        except (requests.RequestException, ValueError) as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            delay = backoff_delay(attempt + 1)
+            rprint(f"[yellow]⚠️ Segment {start:.2f}s failed ({e}), retrying in {delay:.1f}s...[/yellow]")
+            time.sleep(delay)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
     
     elapsed_time = time.time() - start_time
-    rprint(f"[green]✓ Transcription completed in {elapsed_time:.2f} seconds[/green]")
-    return response.json()
+    rprint(f"[green]✓ Segment {start:.2f}s transcribed in {elapsed_time:.2f} seconds[/green]")
+    return _shift_timestamps(result, start)
+
+def transcribe_segments_302(audio_path: str, segments):
+    """Upload segments concurrently, yield results in segment order"""
+    load_audio_buffer(audio_path)
+    with ThreadPoolExecutor(max_workers=max(1, load_key("whisperX_302_concurrency"))) as pool:
+        futures = [pool.submit(transcribe_audio_302, audio_path, start, end) for start, end in segments]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
 
 if __name__ == "__main__":  
     # 使用示例:
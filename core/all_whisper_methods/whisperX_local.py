@@ -5,21 +5,69 @@ warnings.filterwarnings("ignore")
 
 import whisperx
 import torch
+import numpy as np
+import gc
 import time
+import threading
 import subprocess
+from functools import lru_cache
+from collections import OrderedDict
 from typing import Dict
 from rich import print as rprint
-import librosa
-import tempfile
 from core.config_utils import load_key
 from core.all_whisper_methods.audio_preprocess import save_language
+from core.all_whisper_methods.audio_decode import load_audio_buffer
 
 """
 WhisperX 的本地部署版本。
 """
 
 MODEL_DIR = load_key("model_dir")
+# per kind (ASR / alignment), least recently used is evicted beyond it; one on CUDA so a second large-v3 never shares an 8GB card
+MAX_RESIDENT_MODELS = 1 if torch.cuda.is_available() else 2
 
+class ModelRegistry:
+    """Keeps loaded models resident across segments and videos, LRU-evicted, keyed by their load parameters"""
+    def __init__(self, max_size=MAX_RESIDENT_MODELS):
+        self.max_size = max_size
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key]
+            # evict before loading so the old and new model are never resident together
+            while self.models and len(self.models) >= self.max_size:
+                # drop the only reference before collecting, or the evicted model stays alive through gc
+                evicted = next(iter(self.models))
+                del self.models[evicted]
+                rprint(f"[yellow]♻️ Releasing model {evicted}[/yellow]")
+                _free_memory()
+            model = loader()
+            self.models[key] = model
+            return model
+
+    def release(self):
+        with self.lock:
+            self.models.clear()
+        _free_memory()
+
+ASR_MODELS = ModelRegistry()
+ALIGN_MODELS = ModelRegistry()
+
+def _free_memory():
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def release_models():
+    """Drop all resident WhisperX models, e.g. when a batch run is over"""
+    ASR_MODELS.release()
+    ALIGN_MODELS.release()
+
+@lru_cache(maxsize=None)
 def check_hf_mirror() -> str:
     """选择最快的 Hugging Face 镜像（Check and return the fastest HF mirror)"""
     mirrors = {
@@ -50,13 +98,9 @@ def check_hf_mirror() -> str:
     rprint(f"[cyan]🚀 Selected mirror:[/cyan] {fastest_url} ({best_time:.2f}s)")
     return fastest_url
 
-def transcribe_audio(audio_file: str, start: float, end: float) -> Dict:
-    os.environ['HF_ENDPOINT'] = check_hf_mirror() #? don't know if it's working...
-    WHISPER_LANGUAGE = load_key("whisper.language")
+def get_device_settings():
+    """Pick device, batch size and compute type for WhisperX"""
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    rprint(f"🚀 Starting WhisperX using device: {device} ...")
-    
-    # 根据 GPU 选择计算参数
     if device == "cuda":
         gpu_mem = torch.cuda.get_device_properties(0).total_memory / (1024**3)
         batch_size = 16 if gpu_mem > 8 else 2
@@ -66,76 +110,153 @@ def transcribe_audio(audio_file: str, start: float, end: float) -> Dict:
         batch_size = 1
         compute_type = "int8"
         rprint(f"[cyan]📦 Batch size:[/cyan] {batch_size}, [cyan]⚙️ Compute type:[/cyan] {compute_type}")
+    return device, batch_size, compute_type
+
+def load_audio_segment(audio_file: str, start: float, end: float):
+    """Zero-copy 16kHz float32 view of [start, end) from the once-decoded audio buffer"""
+    return load_audio_buffer(audio_file).slice(start, end)
+
+PROBE_MODEL = "tiny"
+PROBE_SAMPLES = 3
+PROBE_SECONDS = 30
+
+def probe_language(audio_file: str, segments) -> str:
+    """Language ID with a tiny faster-whisper model on a few short samples spread over the speech segments"""
+    from faster_whisper import WhisperModel
+    start_time = time.time()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    buffer = load_audio_buffer(audio_file)
+    spans = sorted(segments, key=lambda seg: seg[1] - seg[0], reverse=True)[:PROBE_SAMPLES]
+    model = WhisperModel(PROBE_MODEL, device=device, compute_type="int8", download_root=MODEL_DIR)
+    votes = {}
+    for seg_start, seg_end in sorted(spans):
+        middle = (seg_start + seg_end) / 2
+        sample = buffer.slice(max(seg_start, middle - PROBE_SECONDS / 2), min(seg_end, middle + PROBE_SECONDS / 2))
+        # language detection runs eagerly, the segment generator is never consumed
+        _, info = model.transcribe(np.ascontiguousarray(sample), beam_size=1)
+        votes[info.language] = votes.get(info.language, 0) + info.language_probability
+    del model
+    _free_memory()
+    language = max(votes, key=votes.get)
+    rprint(f"[cyan]🔎 Language probe:[/cyan] {language} ({', '.join(f'{k}={v:.2f}' for k, v in votes.items())}) in {time.time() - start_time:.1f}s")
+    return language
+
+def prepare_language(audio_file: str, segments, preload_align: bool = True) -> str:
+    """
+    Decide the transcription language before the main model loads: a configured zh or no speech skips the probe, otherwise
+    the probe result wins for auto and for zh content (which needs the Belle model), else the configured language.
+    Saves the detected language once and preloads the alignment model in this process.
+    """
+    WHISPER_LANGUAGE = load_key("whisper.language")
+    if WHISPER_LANGUAGE == 'zh':
+        language = 'zh'
+    elif not segments:
+        # the VAD gate found no speech (silent or music-only audio), there is nothing to probe
+        language = 'en' if 'auto' in WHISPER_LANGUAGE else WHISPER_LANGUAGE
+        rprint(f"[yellow]⚠️ No speech segments to probe, using language {language}[/yellow]")
+    else:
+        detected = probe_language(audio_file, segments)
+        if 'auto' in WHISPER_LANGUAGE or detected == 'zh':
+            if detected == 'zh' and 'auto' not in WHISPER_LANGUAGE:
+                rprint(f"[yellow]⚠️ Configured language is {WHISPER_LANGUAGE} but the audio is Chinese, using the zh model[/yellow]")
+            language = detected
+        else:
+            language = WHISPER_LANGUAGE
+    save_language(language)
+    if preload_align:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        ALIGN_MODELS.get((language, device), lambda: whisperx.load_align_model(language_code=language, device=device))
+    return language
+
+def transcribe_segment(audio_segment, start: float, end: float, threads: int = 4, language: str = None) -> Dict:
+    """
+    Run Whisper ASR on a decoded segment, timestamps stay relative to the segment. `threads` is the CTranslate2 CPU
+    thread count; `language` comes from prepare_language, without it the configured language is used and checked afterwards.
+    """
+    os.environ['HF_ENDPOINT'] = check_hf_mirror() #? don't know if it's working...
+    WHISPER_LANGUAGE = language or load_key("whisper.language")
+    device, batch_size, compute_type = get_device_settings()
+    rprint(f"🚀 Starting WhisperX using device: {device} ...")
     rprint(f"[green]▶️ Starting WhisperX for segment {start:.2f}s to {end:.2f}s...[/green]")
     
-    try:
-        #  加载 Whisper 语音识别模型
-        if WHISPER_LANGUAGE == 'zh':
-            model_name = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
-            local_model = os.path.join(MODEL_DIR, "Belle-whisper-large-v3-zh-punct-fasterwhisper")
-        else:
-            model_name = load_key("whisper.model")
-            local_model = os.path.join(MODEL_DIR, model_name)
-            
-        if os.path.exists(local_model):
-            rprint(f"[green]📥 Loading local WHISPER model:[/green] {local_model} ...")
-            model_name = local_model
-        else:
-            rprint(f"[green]📥 Using WHISPER model from HuggingFace:[/green] {model_name} ...")
+    #  加载 Whisper 语音识别模型
+    if WHISPER_LANGUAGE == 'zh':
+        model_name = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
+        local_model = os.path.join(MODEL_DIR, "Belle-whisper-large-v3-zh-punct-fasterwhisper")
+    else:
+        model_name = load_key("whisper.model")
+        local_model = os.path.join(MODEL_DIR, model_name)
+        
+    if os.path.exists(local_model):
+        rprint(f"[green]📥 Loading local WHISPER model:[/green] {local_model} ...")
+        model_name = local_model
+    else:
+        rprint(f"[green]📥 Using WHISPER model from HuggingFace:[/green] {model_name} ...")
 
-        vad_options = {"vad_onset": 0.500,"vad_offset": 0.363}
-        asr_options = {"temperatures": [0],"initial_prompt": "",}
-        whisper_language = None if 'auto' in WHISPER_LANGUAGE else WHISPER_LANGUAGE
-        rprint("[bold yellow]**You can ignore warning of `Model was trained with torch 1.10.0+cu102, yours is 2.0.0+cu118...`**[/bold yellow]")
-        model = whisperx.load_model(model_name, device, compute_type=compute_type, language=whisper_language, vad_options=vad_options, asr_options=asr_options, download_root=MODEL_DIR)
+    vad_options = {"vad_onset": 0.500,"vad_offset": 0.363}
+    asr_options = {"temperatures": [0],"initial_prompt": "",}
+    whisper_language = None if 'auto' in WHISPER_LANGUAGE else WHISPER_LANGUAGE
+    rprint("[bold yellow]**You can ignore warning of `Model was trained with torch 1.10.0+cu102, yours is 2.0.0+cu118...`**[/bold yellow]")
+    model = ASR_MODELS.get(
+        (model_name, compute_type, whisper_language, device, threads),
+        lambda: whisperx.load_model(model_name, device, compute_type=compute_type, language=whisper_language, vad_options=vad_options, asr_options=asr_options, download_root=MODEL_DIR, threads=threads)
+    )
 
-        # Create temp file with wav format for better compatibility
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
-            temp_audio_path = temp_audio.name
-        
-        # Extract audio segment using ffmpeg
-        ffmpeg_cmd = f'ffmpeg -y -i "{audio_file}" -ss {start} -t {end-start} -vn -ar 32000 -ac 1 "{temp_audio_path}"'
-        subprocess.run(ffmpeg_cmd, shell=True, check=True, capture_output=True)
-        
-        try:
-            # Load audio segment with librosa
-            audio_segment, sample_rate = librosa.load(temp_audio_path, sr=16000)
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_audio_path):
-                os.unlink(temp_audio_path)
-
-        rprint("[bold green]note: You will see Progress if working correctly[/bold green]")
-        # 运行 WhisperX 进行转录
-        result = model.transcribe(audio_segment, batch_size=batch_size, print_progress=True)
-
-        # Free GPU resources
-        del model
-        torch.cuda.empty_cache()
+    rprint("[bold green]note: You will see Progress if working correctly[/bold green]")
+    # 运行 WhisperX 进行转录
+    result = model.transcribe(audio_segment, batch_size=batch_size, print_progress=True)
 
+    if language is None:
         # Save language
         save_language(result['language'])
         if result['language'] == 'zh' and WHISPER_LANGUAGE != 'zh':
             raise ValueError("Please specify the transcription language as zh and try again!")
+    return result
 
-        # Align whisper output 使用对齐模型，优化文本时间戳。
-        model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=device)
-        result = whisperx.align(result["segments"], model_a, metadata, audio_segment, device, return_char_alignments=False)
+def align_segment(result: Dict, audio_segment, start: float) -> Dict:
+    """Word-align an ASR result and shift its timestamps by the segment start"""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    # Align whisper output 使用对齐模型，优化文本时间戳。
+    model_a, metadata = ALIGN_MODELS.get(
+        (result["language"], device),
+        lambda: whisperx.load_align_model(language_code=result["language"], device=device)
+    )
+    result = whisperx.align(result["segments"], model_a, metadata, audio_segment, device, return_char_alignments=False)
 
-        # Free GPU resources again
-        torch.cuda.empty_cache()
-        del model_a
-
-        # Adjust timestamps
-        for segment in result['segments']:
-            segment['start'] += start
-            segment['end'] += start
-            for word in segment['words']:
-                if 'start' in word:
-                    word['start'] += start
-                if 'end' in word:
-                    word['end'] += start
-        return result
+    # Adjust timestamps
+    for segment in result['segments']:
+        segment['start'] += start
+        segment['end'] += start
+        for word in segment['words']:
+            if 'start' in word:
+                word['start'] += start
+            if 'end' in word:
+                word['end'] += start
+    return result
+
+def cpu_parallel_settings(num_segments: int):
+    """(workers, threads per worker) so that workers * threads covers every core"""
+    cpu_set = load_key("whisper_cpu_parallel")
+    cores = os.cpu_count() or 1
+    workers = cpu_set["workers"] or max(1, cores // 8)
+    workers = max(1, min(workers, num_segments, cores))
+    threads = cpu_set["cpu_threads"] or max(1, cores // workers)
+    return workers, threads
+
+def _init_cpu_worker(threads: int):
+    # alignment runs in torch, keep each worker to its share of the cores
+    torch.set_num_threads(threads)
+
+def _transcribe_in_worker(audio_file: str, start: float, end: float, threads: int, language: str = None) -> Dict:
+    audio_segment = load_audio_segment(audio_file, start, end)
+    result = transcribe_segment(audio_segment, start, end, threads=threads, language=language)
+    return align_segment(result, audio_segment, start)
+
+def transcribe_audio(audio_file: str, start: float, end: float) -> Dict:
+    try:
+        audio_segment = load_audio_segment(audio_file, start, end)
+        result = transcribe_segment(audio_segment, start, end)
+        return align_segment(result, audio_segment, start)
     except Exception as e:
         rprint(f"[red]WhisperX processing error:[/red] {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,145 @@
+import os, sys, json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Dict, List
+from rich import print as rprint
+from core.config_utils import load_key
+
+"""
+跨任务的音频产物缓存：以输入媒体内容哈希 + 处理参数为键，缓存 raw / vocal / background 音频。
+    output 目录被清空后（prepare_output_folder、onekeycleanup），同一素材再次处理时直接复用。
+    优先 reflink，其次硬链接，最后复制到工作目录。
+    超出 artifact_cache.max_gb 时按最久未使用淘汰；默认 max_gb 为 0，即不启用（每次启用都要对输入做一次 sha256）。
+    注意：ASR 用的 16kHz PCM 直接由 ffmpeg 解码到 output/audio，不经过缓存，命中时从 raw.mp3 重新解码。
+"""
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HASH_CHUNK = 4 * 1024 * 1024
+_LOCK = threading.Lock()
+
+def _cache_dir() -> str:
+    # relative dirs are taken from the repo root, not the current working directory
+    return os.path.join(ROOT_DIR, load_key("artifact_cache.dir"))
+
+def _enabled() -> bool:
+    return load_key("artifact_cache.max_gb") > 0
+
+def _read_json(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+def _write_json(path: str, data: Dict):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def file_digest(path: str) -> str:
+    """sha256 of the file content, memoized per (device, inode, size, mtime) so hardlinked copies hash once"""
+    stat = os.stat(path)
+    stamp = f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+    memo_file = os.path.join(_cache_dir(), 'hashes.json')
+    with _LOCK:
+        memo = _read_json(memo_file)
+        if stamp in memo:
+            return memo[stamp]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _LOCK:
+        os.makedirs(_cache_dir(), exist_ok=True)
+        memo = _read_json(memo_file)
+        memo[stamp] = digest
+        _write_json(memo_file, memo)
+    return digest
+
+def _object_path(key: str, name: str) -> str:
+    return os.path.join(_cache_dir(), 'objects', key[:2], key, name)
+
+def _link_or_copy(src: str, dst: str):
+    """reflink (copy-on-write) -> hardlink -> plain copy"""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+    if sys.platform.startswith('linux') or sys.platform == 'darwin':
+        flag = '--reflink=always' if sys.platform.startswith('linux') else '-c'
+        if subprocess.run(['cp', flag, src, dst], capture_output=True).returncode == 0:
+            return
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+
+def _touch(key: str, size: int = None):
+    index_file = os.path.join(_cache_dir(), 'index.json')
+    index = _read_json(index_file)
+    entry = index.get(key, {})
+    entry['atime'] = time.time()
+    if size is not None:
+        entry['size'] = size
+    index[key] = entry
+    _write_json(index_file, index)
+    return index
+
+def _evict(index: Dict, keep_key: str):
+    max_bytes = load_key("artifact_cache.max_gb") * 1024 ** 3
+    total = sum(entry.get('size', 0) for entry in index.values())
+    for key, entry in sorted(index.items(), key=lambda kv: kv[1].get('atime', 0)):
+        if total <= max_bytes:
+            break
+        if key == keep_key:
+            continue
+        shutil.rmtree(os.path.join(_cache_dir(), 'objects', key[:2], key), ignore_errors=True)
+        total -= entry.get('size', 0)
+        del index[key]
+        rprint(f"[yellow]🧹 Evicted cached artifact {key[:12]}[/yellow]")
+    _write_json(os.path.join(_cache_dir(), 'index.json'), index)
+
+def artifact_key(step: str, inputs: List[str], params: Dict) -> str:
+    raw = json.dumps({"step": step, "inputs": [file_digest(path) for path in inputs], "params": params}, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def cached_artifact(step: str, inputs: List[str], params: Dict, outputs: List[str], produce: Callable[[], None]) -> bool:
+    """
+    Materialise `outputs` from the cache when the same inputs were processed with the same params before,
+    otherwise run `produce()` and store its outputs. Returns True on a cache hit.
+    """
+    if not _enabled():
+        produce()
+        return False
+    key = artifact_key(step, inputs, params)
+    cached = [_object_path(key, os.path.basename(output)) for output in outputs]
+    if all(os.path.exists(path) for path in cached):
+        for path, output in zip(cached, outputs):
+            _link_or_copy(path, output)
+        with _LOCK:
+            _touch(key)
+        rprint(f"[green]♻️ Reused cached {step} for {', '.join(outputs)}[/green]")
+        return True
+
+    # outputs may be hardlinks into the cache from an earlier run, never let ffmpeg -y truncate them in place
+    for output in outputs:
+        if os.path.exists(output):
+            os.remove(output)
+    produce()
+    for path, output in zip(cached, outputs):
+        _link_or_copy(output, path)
+    with _LOCK:
+        index = _touch(key, sum(os.path.getsize(path) for path in cached))
+        _evict(index, key)
+    return False
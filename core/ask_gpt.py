@@ -1,12 +1,16 @@
 import os, sys, json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from threading import Lock
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import json_repair
 import json 
 from openai import OpenAI
 import time
 from requests.exceptions import RequestException
 from core.config_utils import load_key
+from core.gpt_cache import get_cached, put_cached
+from core.llm_scheduler import get_scheduler, estimate_tokens, backoff_delay, get_retry_after, is_rate_limited
 
 """
 调用 GPT 模型，可能用于字幕优化或翻译辅助。
@@ -14,6 +18,18 @@ from core.config_utils import load_key
 
 LOG_FOLDER = 'output/gpt_log'
 LOCK = Lock()
+MAX_RATE_LIMIT_RETRIES = 8  # 429s wait and retry without using up the normal attempts
+_CLIENTS = {}
+_CLIENTS_LOCK = Lock()
+
+def get_client(base_url, api_key):
+    """Process-wide OpenAI client per (base_url, key), so threads share one HTTP connection pool"""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get((base_url, api_key))
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)  # retries are paced by llm_scheduler
+            _CLIENTS[(base_url, api_key)] = client
+    return client
 
 def save_log(model, prompt, response, log_title = 'default', message = None):
     os.makedirs(LOG_FOLDER, exist_ok=True)
@@ -25,6 +41,10 @@ def save_log(model, prompt, response, log_title = 'default', message = None):
     }
     log_file = os.path.join(LOG_FOLDER, f"{log_title}.json")
     
+    with LOCK:
+        _append_log(log_file, log_data)
+
+def _append_log(log_file, log_data):
     if os.path.exists(log_file):
         with open(log_file, 'r', encoding='utf-8') as f:
             logs = json.load(f)
@@ -34,26 +54,17 @@ def save_log(model, prompt, response, log_title = 'default', message = None):
     with open(log_file, 'w', encoding='utf-8') as f:
         json.dump(logs, f, ensure_ascii=False, indent=4)
         
-def check_ask_gpt_history(prompt, model, log_title):
+def check_ask_gpt_history(prompt, model, log_title, response_json=True):
     # check if the prompt has been asked before
-    if not os.path.exists(LOG_FOLDER):
-        return False
-    file_path = os.path.join(LOG_FOLDER, f"{log_title}.json")
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            for item in data:
-                if item["prompt"] == prompt:
-                    return item["response"]
-    return False
+    cached = get_cached(model, prompt, response_json, log_title)
+    return cached if cached is not None else False
 
 def ask_gpt(prompt, response_json=True, valid_def=None, log_title='default'):
     api_set = load_key("api")
     llm_support_json = load_key("llm_support_json")
-    with LOCK:
-        history_response = check_ask_gpt_history(prompt, api_set["model"], log_title)
-        if history_response:
-            return history_response
+    history_response = check_ask_gpt_history(prompt, api_set["model"], log_title, response_json)
+    if history_response:
+        return history_response
     
     if not api_set["key"]:
         raise ValueError(f"⚠️API_KEY is missing")
@@ -61,11 +72,14 @@ def ask_gpt(prompt, response_json=True, valid_def=None, log_title='default'):
     messages = [{"role": "user", "content": prompt}]
     
     base_url = api_set["base_url"].strip('/') + '/v1' if 'v1' not in api_set["base_url"] else api_set["base_url"]
-    client = OpenAI(api_key=api_set["key"], base_url=base_url)
+    client = get_client(base_url, api_set["key"])
     response_format = {"type": "json_object"} if response_json and api_set["model"] in llm_support_json else None
 
+    scheduler = get_scheduler()
+    prompt_tokens = estimate_tokens(prompt)
     max_retries = 3
-    for attempt in range(max_retries):
+    attempt, rate_limit_retries = 0, 0
+    while attempt < max_retries:
         try:
             completion_args = {
                 "model": api_set["model"],
@@ -74,7 +88,14 @@ def ask_gpt(prompt, response_json=True, valid_def=None, log_title='default'):
             if response_format is not None:
                 completion_args["response_format"] = response_format
                 
-            response = client.chat.completions.create(**completion_args)
+            scheduler.acquire(prompt_tokens)
+            request_start = time.time()
+            try:
+                response = client.chat.completions.create(**completion_args)
+            except Exception as e:
+                scheduler.release(log_title, time.time() - request_start, prompt_tokens, error=e)
+                raise
+            scheduler.release(log_title, time.time() - request_start, prompt_tokens, usage=getattr(response, 'usage', None))
             
             if response_json:
                 try:
@@ -99,20 +120,57 @@ def ask_gpt(prompt, response_json=True, valid_def=None, log_title='default'):
                 break  # Non-JSON format, break the loop directly
                 
         except Exception as e:
+            if is_rate_limited(e) and rate_limit_retries < MAX_RATE_LIMIT_RETRIES:
+                rate_limit_retries += 1
+                delay = backoff_delay(rate_limit_retries, get_retry_after(e))
+                print(f"Rate limited, waiting {delay:.1f}s ({rate_limit_retries}/{MAX_RATE_LIMIT_RETRIES})...")
+                time.sleep(delay)
+                continue
             if attempt < max_retries - 1:
                 if isinstance(e, RequestException):
                     print(f"Request error: {e}. Retrying ({attempt + 1}/{max_retries})...")
                 else:
                     print(f"Unexpected error occurred: {e}\nRetrying...")
-                time.sleep(2)
+                time.sleep(backoff_delay(attempt + 1, get_retry_after(e)))
             else:
                 raise Exception(f"Still failed after {max_retries} attempts: {e}")
-    with LOCK:
-        if log_title != 'None':
-            save_log(api_set["model"], prompt, response_data, log_title=log_title)
+        attempt += 1
+    if log_title != 'None':
+        put_cached(api_set["model"], prompt, response_data, response_json, log_title=log_title)
 
     return response_data
 
+async def ask_gpt_async(prompt, response_json=True, valid_def=None, log_title='default', semaphore=None):
+    """Awaitable ask_gpt, runs on the pooled client in a worker thread, bounded by `semaphore` if given"""
+    if semaphore is None:
+        return await asyncio.to_thread(ask_gpt, prompt, response_json, valid_def, log_title)
+    async with semaphore:
+        return await asyncio.to_thread(ask_gpt, prompt, response_json, valid_def, log_title)
+
+def ask_gpt_many(prompts, response_json=True, valid_def=None, log_title='default', max_concurrency=None):
+    """
+    Send a batch of prompts with at most `max_concurrency` (default max_workers) in flight, results keep input order.
+    Blocking; inside a running event loop (e.g. Jupyter) it falls back to a thread pool, use ask_gpt_async there instead.
+    """
+    prompts = list(prompts)
+    if not prompts:
+        return []
+    max_concurrency = max_concurrency or load_key("max_workers")
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        # asyncio.run cannot nest in a running loop
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            return list(pool.map(lambda p: ask_gpt(p, response_json, valid_def, log_title), prompts))
+
+    async def _gather():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*(ask_gpt_async(p, response_json, valid_def, log_title, semaphore) for p in prompts))
+    return asyncio.run(_gather())
+
 
 if __name__ == '__main__':
     print(ask_gpt('hi there hey response in json format, just return 200.' , response_json=True, log_title=None))
\ No newline at end of file
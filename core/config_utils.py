@@ -1,6 +1,8 @@
 from ruamel.yaml import YAML
-from typing import Any
+from typing import Any, Type, TypeVar
 import os, sys
+import copy
+import tempfile
 import threading
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,21 +13,85 @@ config_lock = threading.Lock()
 yaml = YAML()
 yaml.preserve_quotes = True
 
-def load_key(key: str) -> Any:
-    with config_lock:
-        with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
-            data = yaml.load(file)
+T = TypeVar('T')
 
-    keys = key.split('.')
-    value = data
-    for k in keys:
-        if isinstance(value, dict) and k in value:
-            value = value[k]
-        else:
-            raise KeyError(f"Key '{k}' not found in configuration")
+# parsed config snapshot, reloaded only when config.yaml changes on disk
+_snapshot_stamp = None
+_snapshot_data = None
+_key_cache = {}
+
+def _file_stamp():
+    stat = os.stat(CONFIG_PATH)
+    return (os.path.abspath(CONFIG_PATH), stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _to_plain(value):
+    """Turn ruamel containers into plain dict/list so cached values are cheap to copy"""
+    if isinstance(value, dict):
+        return {k: _to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
     return value
 
+def _get_snapshot():
+    global _snapshot_stamp, _snapshot_data, _key_cache
+    stamp = _file_stamp()
+    if stamp != _snapshot_stamp:
+        with config_lock:
+            if stamp != _snapshot_stamp:
+                with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
+                    _snapshot_data = _to_plain(yaml.load(file))
+                _key_cache = {}
+                _snapshot_stamp = stamp
+    return _snapshot_data, _key_cache
+
+def load_key(key: str) -> Any:
+    data, key_cache = _get_snapshot()
+    try:
+        value = key_cache[key]
+    except KeyError:
+        keys = key.split('.')
+        value = data
+        for k in keys:
+            if isinstance(value, dict) and k in value:
+                value = value[k]
+            else:
+                raise KeyError(f"Key '{k}' not found in configuration")
+        key_cache[key] = value
+    # callers may mutate what they get back, never hand out the cached object
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+def load_key_as(key: str, expected_type: Type[T]) -> T:
+    """load_key with a type check, e.g. load_key_as("max_workers", int)"""
+    value = load_key(key)
+    if isinstance(value, expected_type):
+        return value
+    if expected_type is bool and isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    try:
+        if expected_type is not bool:
+            return expected_type(value)
+    except (TypeError, ValueError):
+        pass
+    raise TypeError(f"Config key '{key}' should be {expected_type.__name__}, got {type(value).__name__}: {value!r}")
+
+def _atomic_dump(data):
+    # write a temp file next to config.yaml then rename over it, readers never see a half-written file
+    config_dir = os.path.dirname(os.path.abspath(CONFIG_PATH))
+    fd, tmp_path = tempfile.mkstemp(prefix='.config.', suffix='.yaml.tmp', dir=config_dir)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            yaml.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, os.stat(CONFIG_PATH).st_mode & 0o777)
+        os.replace(tmp_path, CONFIG_PATH)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
 def update_key(key: str, new_value: Any) -> bool:
+    global _snapshot_stamp
     with config_lock:
         with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
             data = yaml.load(file)
@@ -40,12 +106,12 @@ def update_key(key: str, new_value: Any) -> bool:
 
         if isinstance(current, dict) and keys[-1] in current:
             current[keys[-1]] = new_value
-            with open(CONFIG_PATH, 'w', encoding='utf-8') as file:
-                yaml.dump(data, file)
+            _atomic_dump(data)
+            _snapshot_stamp = None
             return True
         else:
             raise KeyError(f"Key '{keys[-1]}' not found in configuration")
-        
+
 # basic utils
 def get_joiner(language):
     if language in load_key('language_split_with_space'):
@@ -0,0 +1,158 @@
+import os, sys, json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import glob
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+from threading import Lock
+from core.config_utils import load_key
+
+"""
+GPT 响应缓存：按 (model, prompt, response_json) 的哈希做内容寻址，存放在 SQLite(WAL) 中。
+    O(1) 命中查询，追加写入，不再每次重写整个 JSON 日志。
+    每个 log_title 一个命名空间。
+    超过 gpt_cache_max_mb 后按最久未访问淘汰。
+    首次使用时导入旧的 output/gpt_log/*.json。
+"""
+
+LOG_FOLDER = 'output/gpt_log'
+CACHE_DB = os.path.join(LOG_FOLDER, 'cache.db')
+EVICT_CHECK_EVERY = 50  # check db size every N inserts
+EVICT_RATIO = 0.1  # drop this fraction of entries per eviction round
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    model TEXT,
+    prompt TEXT,
+    response TEXT,
+    created REAL,
+    accessed REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed);
+CREATE TABLE IF NOT EXISTS migrations (
+    file TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER
+);
+"""
+
+_init_lock = Lock()
+_initialized = set()
+_insert_count = 0
+
+def cache_key(model, prompt, response_json=True) -> str:
+    raw = json.dumps([model, prompt, bool(response_json)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _connect(db_path):
+    # a short-lived connection per call: cheap next to an LLM round-trip, and it
+    # never keeps writing into a db file that onekeycleanup has moved away
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _ensure_db(db_path=CACHE_DB):
+    """Create the schema (WAL mode) and import legacy JSON logs once per process."""
+    if db_path in _initialized and os.path.exists(db_path):
+        return
+    with _init_lock:
+        if os.path.exists(db_path) and db_path in _initialized:
+            return
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with closing(_connect(db_path)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            migrate_json_logs(conn, os.path.dirname(db_path) or '.')
+        _initialized.add(db_path)
+
+def migrate_json_logs(conn, log_folder=LOG_FOLDER) -> int:
+    """Import old `{log_title}.json` list logs into the cache, skipping files already imported."""
+    imported = 0
+    for file in sorted(glob.glob(os.path.join(log_folder, '*.json'))):
+        namespace = os.path.splitext(os.path.basename(file))[0]
+        if namespace == 'error' or namespace.endswith('_export'):
+            continue
+        stat = os.stat(file)
+        row = conn.execute("SELECT mtime, size FROM migrations WHERE file = ?", (file,)).fetchone()
+        if row and row[0] == stat.st_mtime and row[1] == stat.st_size:
+            continue
+        try:
+            with open(file, 'r', encoding='utf-8') as f:
+                logs = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping unreadable gpt log {file}: {e}")
+            continue
+        now = time.time()
+        rows = []
+        for item in logs if isinstance(logs, list) else []:
+            if not isinstance(item, dict) or 'prompt' not in item:
+                continue
+            response = item.get('response')
+            # old logs did not record response_json; non-string responses came from json mode
+            response_json = not isinstance(response, str)
+            rows.append((namespace, cache_key(item.get('model'), item['prompt'], response_json),
+                         item.get('model'), item['prompt'], json.dumps(response, ensure_ascii=False), now, now))
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR IGNORE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO migrations VALUES (?, ?, ?)", (file, stat.st_mtime, stat.st_size))
+        conn.execute("COMMIT")
+        imported += len(rows)
+    if imported:
+        print(f"📦 Imported {imported} cached GPT responses from {log_folder}")
+    return imported
+
+def get_cached(model, prompt, response_json=True, log_title='default', db_path=CACHE_DB):
+    """Return the cached response or None."""
+    _ensure_db(db_path)
+    key = cache_key(model, prompt, response_json)
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute("SELECT response FROM responses WHERE namespace = ? AND key = ?",
+                           (str(log_title), key)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE responses SET accessed = ? WHERE namespace = ? AND key = ?",
+                     (time.time(), str(log_title), key))
+    return json.loads(row[0])
+
+def put_cached(model, prompt, response, response_json=True, log_title='default', db_path=CACHE_DB):
+    global _insert_count
+    _ensure_db(db_path)
+    now = time.time()
+    with closing(_connect(db_path)) as conn:
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (str(log_title), cache_key(model, prompt, response_json), model, prompt,
+                      json.dumps(response, ensure_ascii=False), now, now))
+        _insert_count += 1
+        if _insert_count % EVICT_CHECK_EVERY == 0:
+            _evict_if_needed(conn)
+
+def _evict_if_needed(conn):
+    max_bytes = load_key("gpt_cache_max_mb") * 1024 * 1024
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    used = (conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]) * page_size
+    if used <= max_bytes:
+        return
+    total = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    drop = max(1, int(total * EVICT_RATIO))
+    conn.execute("DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY accessed LIMIT ?)", (drop,))
+    print(f"🧹 GPT cache over {max_bytes // (1024 * 1024)}MB, evicted {drop} least recently used entries")
+
+def export_namespace(log_title, output_file=None, db_path=CACHE_DB):
+    """Dump one namespace to the old list-of-dicts JSON layout for manual inspection."""
+    _ensure_db(db_path)
+    with closing(_connect(db_path)) as conn:
+        rows = conn.execute("SELECT model, prompt, response FROM responses WHERE namespace = ? ORDER BY created",
+                            (str(log_title),)).fetchall()
+    logs = [{"model": m, "prompt": p, "response": json.loads(r), "message": None} for m, p, r in rows]
+    output_file = output_file or os.path.join(os.path.dirname(db_path), f"{log_title}_export.json")
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(logs, f, ensure_ascii=False, indent=4)
+    return output_file
+
+if __name__ == '__main__':
+    # e.g. python core/gpt_cache.py translate_expressiveness
+    print(export_namespace(sys.argv[1] if len(sys.argv) > 1 else 'default'))
@@ -0,0 +1,98 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ast
+import numpy as np
+import pandas as pd
+from rich import print as rprint
+from core.config_utils import load_key
+
+"""
+步骤之间的中间表存储：用 Parquet 列式文件代替 Excel 往返。
+    每个产物有一个小 schema，列表列（lines、new_sub_times 等）原生保存，不再把字符串 eval 回来。
+    Excel 只作为可选的导出视图（export_excel）。
+    兼容读取旧任务留下的 .xlsx，列表列用 ast.literal_eval 解析。
+"""
+
+# name -> (path without extension, {column: type}); columns not listed are stored as pandas infers them
+ARTIFACTS = {
+    'cleaned_chunks': ('output/log/cleaned_chunks', {'text': str, 'start': float, 'end': float, 'segment_id': int, 'confidence': float}),
+    'translation_results': ('output/log/translation_results', {'Source': str, 'Translation': str, 'timestamp': str, 'duration': float}),
+    'translation_results_for_subtitles': ('output/log/translation_results_for_subtitles', {'Source': str, 'Translation': str}),
+    'translation_results_remerged': ('output/log/translation_results_remerged', {'Source': str, 'Translation': str}),
+    'tts_tasks': ('output/audio/tts_tasks', {'number': int, 'start_time': str, 'end_time': str, 'duration': float,
+                                             'text': str, 'origin': str, 'lines': list, 'src_lines': list, 'new_sub_times': list}),
+}
+
+def _unquote_words(df: pd.DataFrame) -> pd.DataFrame:
+    # word tables used to be saved as '"word"' so Excel kept them as text
+    df['text'] = df['text'].str.strip('"')
+    return df
+
+# fixes applied to legacy .xlsx artifacts only
+LEGACY_FIXES = {'cleaned_chunks': _unquote_words}
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def _to_list(value):
+    """Parquet list cells come back as numpy arrays, possibly nested"""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_to_list(v) for v in value]
+    return value
+
+def _parse_list(value):
+    if _is_missing(value):
+        return None
+    # old Excel artifacts hold the repr of the list
+    return _to_list(ast.literal_eval(value) if isinstance(value, str) else value)
+
+def _coerce(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    for column, kind in schema.items():
+        if column not in df.columns:
+            continue
+        if kind is str:
+            df[column] = df[column].map(lambda v: None if _is_missing(v) else str(v)).astype(object)
+        elif kind is float:
+            df[column] = pd.to_numeric(df[column]).astype('float64')
+        elif kind is int:
+            df[column] = pd.to_numeric(df[column]).astype('int64')
+        elif kind is list:
+            df[column] = df[column].map(_parse_list).astype(object)
+    return df
+
+def table_file(name: str) -> str:
+    """Path of the stored table: the Parquet file, or a legacy .xlsx when only that exists"""
+    base, _ = ARTIFACTS[name]
+    if not os.path.exists(base + '.parquet') and os.path.exists(base + '.xlsx'):
+        return base + '.xlsx'
+    return base + '.parquet'
+
+def table_exists(name: str) -> bool:
+    return os.path.exists(table_file(name))
+
+def save_table(name: str, df: pd.DataFrame):
+    base, schema = ARTIFACTS[name]
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    df = _coerce(df.reset_index(drop=True).copy(), schema)
+    tmp_file = base + '.parquet.tmp'
+    df.to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, base + '.parquet')
+    if load_key("export_excel"):
+        export = df.copy()
+        for column, kind in schema.items():
+            if kind is list and column in export.columns:
+                export[column] = export[column].map(lambda v: None if v is None else repr(v))
+        export.to_excel(base + '.xlsx', index=False)
+
+def load_table(name: str) -> pd.DataFrame:
+    _, schema = ARTIFACTS[name]
+    path = table_file(name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{name} not found, expected {path}")
+    if path.endswith('.xlsx'):
+        rprint(f"[yellow]📄 Reading legacy Excel artifact {path}[/yellow]")
+        df = _coerce(pd.read_excel(path), schema)
+        return LEGACY_FIXES.get(name, lambda d: d)(df)
+    return _coerce(pd.read_parquet(path), schema)
@@ -0,0 +1,188 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import random
+import threading
+from collections import defaultdict
+from rich.console import Console
+from rich.table import Table
+from core.config_utils import load_key
+
+"""
+LLM 调用调度：每次 ask_gpt 前经过令牌桶（每分钟请求数 / 每分钟 token 数）。
+    估算 prompt token 数。
+    指数退避 + 抖动，遵守 429 的 Retry-After。
+    根据延迟和错误率自动调整并发（AIMD）。
+    按阶段（log_title）统计 token 用量和吞吐。
+"""
+
+console = Console()
+
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+LATENCY_WINDOW = 20  # successes used for the latency baseline
+LATENCY_SLOWDOWN = 3  # latency above this multiple of the baseline halves the concurrency
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: CJK characters ~1 token each, everything else ~4 characters per token"""
+    text = str(text)
+    cjk = sum(1 for c in text if 0x3040 <= ord(c) <= 0x9FFF or 0xAC00 <= ord(c) <= 0xD7A3)
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def get_retry_after(error) -> float:
+    """Seconds from a Retry-After / retry-after-ms header on an API error, or None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+def is_rate_limited(error) -> bool:
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """Exponential backoff with full jitter, Retry-After wins when the server sent one"""
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class TokenBucket:
+    """Refills `rate_per_min` units per minute; the level may go negative to repay under-estimates"""
+    def __init__(self, rate_per_min: float):
+        self.rate = rate_per_min / 60
+        self.capacity = rate_per_min
+        self.level = rate_per_min
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        with self.lock:
+            self._refill()
+            self.level -= amount
+
+class LLMScheduler:
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_concurrency: int = 4):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.latencies = []
+        self.successes_since_change = 0
+        self.usage = defaultdict(lambda: defaultdict(float))
+
+    def acquire(self, prompt_tokens: int):
+        # wait on the rate limits before taking a slot, so a slot is only held while the request is on the wire
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(prompt_tokens)
+        with self.cond:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, stage: str, latency: float, prompt_tokens: int, usage=None, error=None):
+        with self.cond:
+            self.in_flight -= 1
+            stats = self.usage[stage]
+            stats['requests'] += 1
+            stats['seconds'] += latency
+            if error is not None:
+                stats['errors'] += 1
+                if is_rate_limited(error) and self.limit > 1:
+                    # multiplicative decrease on 429
+                    self.limit = max(1, self.limit // 2)
+                    self.successes_since_change = 0
+                    console.print(f"[yellow]⏬ LLM rate limited, concurrency lowered to {self.limit}[/yellow]")
+            else:
+                used_prompt = getattr(usage, 'prompt_tokens', None) or prompt_tokens
+                used_completion = getattr(usage, 'completion_tokens', None) or 0
+                stats['prompt_tokens'] += used_prompt
+                stats['completion_tokens'] += used_completion
+                if self.token_bucket:
+                    self.token_bucket.adjust(used_prompt + used_completion - prompt_tokens)
+                self._on_success(latency)
+            self.cond.notify_all()
+
+    def _on_success(self, latency: float):
+        # additive increase while latency stays near its baseline, multiplicative decrease when it blows up
+        self.latencies = (self.latencies + [latency])[-LATENCY_WINDOW:]
+        self.successes_since_change += 1
+        if self.successes_since_change < self.limit:
+            return
+        baseline = sorted(self.latencies)[len(self.latencies) // 2]
+        if len(self.latencies) == LATENCY_WINDOW and latency > baseline * LATENCY_SLOWDOWN and self.limit > 1:
+            self.limit = max(1, self.limit // 2)
+            self.successes_since_change = 0
+            console.print(f"[yellow]⏬ LLM latency {latency:.1f}s vs {baseline:.1f}s baseline, concurrency lowered to {self.limit}[/yellow]")
+        elif latency <= baseline * 2 and self.limit < self.max_concurrency:
+            self.limit += 1
+            self.successes_since_change = 0
+
+    def report(self):
+        if not self.usage:
+            return
+        table = Table(title="📊 LLM usage by stage")
+        for column in ["Stage", "Requests", "Errors", "Prompt tokens", "Completion tokens", "Tokens/s"]:
+            table.add_column(column)
+        for stage, stats in sorted(self.usage.items()):
+            tokens = stats['prompt_tokens'] + stats['completion_tokens']
+            table.add_row(stage, f"{stats['requests']:.0f}", f"{stats['errors']:.0f}",
+                          f"{stats['prompt_tokens']:.0f}", f"{stats['completion_tokens']:.0f}",
+                          f"{tokens / stats['seconds']:.1f}" if stats['seconds'] else "-")
+        console.print(table)
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+_SCHEDULER_SETTINGS = None
+
+def get_scheduler() -> LLMScheduler:
+    """The shared scheduler, rebuilt when max_workers or llm_rate_limit changed since it was built (e.g. in the web UI)"""
+    global _SCHEDULER, _SCHEDULER_SETTINGS
+    limits = load_key("llm_rate_limit")
+    settings = (limits["rpm"], limits["tpm"], load_key("max_workers"))
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None or settings != _SCHEDULER_SETTINGS:
+            previous = _SCHEDULER
+            _SCHEDULER = LLMScheduler(rpm=settings[0], tpm=settings[1], max_concurrency=settings[2])
+            _SCHEDULER_SETTINGS = settings
+            if previous is not None:
+                console.print(f"[yellow]🔧 LLM rate settings changed, rebuilding the scheduler (rpm, tpm, max_workers) = {settings}[/yellow]")
+                # requests already in flight finish on the old scheduler, usage of this run carries over
+                _SCHEDULER.usage = previous.usage
+    return _SCHEDULER
+
+def report_usage(reset: bool = False):
+    """Print per-stage token usage and throughput, optionally starting a fresh scheduler afterwards"""
+    global _SCHEDULER
+    if _SCHEDULER is not None:
+        _SCHEDULER.report()
+        if reset:
+            with _SCHEDULER_LOCK:
+                _SCHEDULER = None
@@ -1,4 +1,6 @@
 import os,sys
+import gc
+import threading
 import spacy
 from spacy.cli import download
 from rich import print
@@ -7,9 +9,44 @@ from core.config_utils import load_key
 
 """
 加载 NLP（自然语言处理）模型。
+    已加载的模型按（模型，排除的组件）常驻在进程内，跨步骤、跨批处理任务复用；切换语言时释放其他语言的模型。
+    批处理可以先调用 warm_nlp 预加载队列中用到的语言。
 """
 
 SPACY_MODEL_MAP = load_key("spacy_model_map")
+# components none of the split stages read
+UNUSED_COMPONENTS = ["ner", "lemmatizer"]
+
+class SpacyRegistry:
+    """Loaded spaCy pipelines keyed by (model, excluded components); a model is per language, so a language change evicts the others"""
+    def __init__(self):
+        self.models = {}
+        self.pinned = set()  # models preloaded for queued batch tasks, kept across language changes
+        self.lock = threading.Lock()
+
+    def get(self, model: str, exclude=()):
+        key = (model, tuple(sorted(exclude)))
+        with self.lock:
+            if key in self.models:
+                return self.models[key]
+            for other in [k for k in self.models if k[0] != model and k[0] not in self.pinned]:
+                print(f"[yellow]♻️ Releasing NLP Spacy model: <{other[0]}>[/yellow]")
+                del self.models[other]
+            gc.collect()
+            self.models[key] = _load_model(model, list(exclude))
+            return self.models[key]
+
+    def pin(self, models):
+        with self.lock:
+            self.pinned = set(models)
+
+    def release(self):
+        with self.lock:
+            self.models.clear()
+            self.pinned = set()
+        gc.collect()
+
+SPACY_MODELS = SpacyRegistry()
 
 def get_spacy_model(language: str):
     model = SPACY_MODEL_MAP.get(language.lower(), "en_core_web_md")
@@ -17,19 +54,54 @@ def get_spacy_model(language: str):
         print(f"[yellow]Spacy model does not support '{language}', using en_core_web_md model as fallback...[/yellow]")
     return model
 
-def init_nlp():
+def _load_model(model: str, exclude):
     try:
-        language = "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
-        model = get_spacy_model(language)
         print(f"[blue]⏳ Loading NLP Spacy model: <{model}> ...[/blue]")
         try:
-            nlp = spacy.load(model)
+            nlp = spacy.load(model, exclude=exclude)
         except:
             print(f"[yellow]Downloading {model} model...[/yellow]")
             print("[yellow]If download failed, please check your network and try again.[/yellow]")
             download(model)
-            nlp = spacy.load(model)
+            nlp = spacy.load(model, exclude=exclude)
     except:
         raise ValueError(f"❌ Failed to load NLP Spacy model: {model}")
     print(f"[green]✅ NLP Spacy model loaded successfully![/green]")
-    return nlp
\ No newline at end of file
+    return nlp
+
+def init_nlp(exclude=UNUSED_COMPONENTS):
+    language = "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
+    return SPACY_MODELS.get(get_spacy_model(language), exclude)
+
+def warm_nlp(languages, exclude=UNUSED_COMPONENTS):
+    """Preload the models of `languages` (e.g. the source languages queued in a batch) and keep them resident"""
+    models = {get_spacy_model(language) for language in languages if language in SPACY_MODEL_MAP}
+    SPACY_MODELS.pin(models)
+    for model in sorted(models):
+        SPACY_MODELS.get(model, exclude)
+
+def release_nlp():
+    """Drop all resident spaCy models, e.g. when a batch run is over"""
+    SPACY_MODELS.release()
+
+def dump_sentences(sentences, path: str, append: bool = False):
+    """Write the sentence spans of an intermediate split stage, only when spacy_debug_dump is on"""
+    if not load_key("spacy_debug_dump"):
+        return
+    with open(path, "a" if append else "w", encoding="utf-8") as output_file:
+        for sentence in sentences:
+            output_file.write(sentence.text.strip() + "\n")
+    if not append:
+        print(f"[blue]📝 Dumping intermediate sentences → `{path}`[/blue]")
+
+def pipe_settings(nlp):
+    """nlp.pipe keyword arguments from spacy_pipe, with the unused components disabled"""
+    pipe_set = load_key("spacy_pipe")
+    return {"batch_size": max(1, pipe_set["batch_size"]), "n_process": max(1, pipe_set["n_process"]),
+            "disable": [name for name in UNUSED_COMPONENTS if name in nlp.pipe_names]}
+
+def report_stage(stage: str, sentences_in, sentences_out: int, seconds: float):
+    """Sentence counts and throughput of one split stage, `sentences_in` is None for the first stage"""
+    rate = sentences_out / seconds if seconds > 0 else float('inf')
+    counts = f"{sentences_out}" if sentences_in is None else f"{sentences_in} → {sentences_out}"
+    print(f"[green]✂️  {stage}: {counts} sentences in {seconds:.2f}s ({rate:.0f} sentences/s)[/green]")
\ No newline at end of file
@@ -1,8 +1,7 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 import os,sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from load_nlp_model import init_nlp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from rich import print
 
 """
@@ -15,8 +14,25 @@ from rich import print
     文本摘要
     信息抽取
     对话系统
+在上一步的句子 Span 上直接切分，切分后的片段复用原 Doc 的句法标注，不重新解析。
 """
 
+# lang -> (connectors, dependencies that make a connector a determiner / pronoun of a noun)
+CONNECTOR_RULES = {
+    "en": (frozenset(["that", "which", "where", "when", "because", "but", "and", "or"]), frozenset(["det", "pron"])),
+    "zh": (frozenset(["因为", "所以", "但是", "而且", "虽然", "如果", "即使", "尽管"]), frozenset(["det", "pron"])),
+    "ja": (frozenset(["けれども", "しかし", "だから", "それで", "ので", "のに", "ため"]), frozenset(["case"])),
+    "fr": (frozenset(["que", "qui", "où", "quand", "parce que", "mais", "et", "ou"]), frozenset(["det", "pron"])),
+    "ru": (frozenset(["что", "который", "где", "когда", "потому что", "но", "и", "или"]), frozenset(["det"])),
+    "es": (frozenset(["que", "cual", "donde", "cuando", "porque", "pero", "y", "o"]), frozenset(["det", "pron"])),
+    "de": (frozenset(["dass", "welche", "wo", "wann", "weil", "aber", "und", "oder"]), frozenset(["det", "pron"])),
+    "it": (frozenset(["che", "quale", "dove", "quando", "perché", "ma", "e", "o"]), frozenset(["det", "pron"])),
+}
+MARK_DEP = "mark"
+VERB_POS = "VERB"
+NOUN_POS = frozenset(["NOUN", "PROPN"])
+CONTRACTIONS = frozenset(["'s", "'re", "'ve", "'ll", "'d"])
+
 def analyze_connectors(doc, token):
     """
     Analyze whether a token is a connector that should trigger a sentence split.
@@ -29,140 +45,68 @@ def analyze_connectors(doc, token):
      5. For coordinating conjunctions, check if they connect two independent clauses.
     """
     lang = doc.lang_
-    if lang == "en":
-        connectors = ["that", "which", "where", "when", "because", "but", "and", "or"]
-        mark_dep = "mark"
-        det_pron_deps = ["det", "pron"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "zh":
-        connectors = ["因为", "所以", "但是", "而且", "虽然", "如果", "即使", "尽管"]
-        mark_dep = "mark"
-        det_pron_deps = ["det", "pron"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "ja":
-        connectors = ["けれども", "しかし", "だから", "それで", "ので", "のに", "ため"]
-        mark_dep = "mark"
-        det_pron_deps = ["case"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "fr":
-        connectors = ["que", "qui", "où", "quand", "parce que", "mais", "et", "ou"]
-        mark_dep = "mark"
-        det_pron_deps = ["det", "pron"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "ru":
-        connectors = ["что", "который", "где", "когда", "потому что", "но", "и", "или"] 
-        mark_dep = "mark"
-        det_pron_deps = ["det"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "es":
-        connectors = ["que", "cual", "donde", "cuando", "porque", "pero", "y", "o"]
-        mark_dep = "mark"
-        det_pron_deps = ["det", "pron"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "de":
-        connectors = ["dass", "welche", "wo", "wann", "weil", "aber", "und", "oder"]
-        mark_dep = "mark"
-        det_pron_deps = ["det", "pron"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    elif lang == "it":
-        connectors = ["che", "quale", "dove", "quando", "perché", "ma", "e", "o"]
-        mark_dep = "mark"
-        det_pron_deps = ["det", "pron"]
-        verb_pos = "VERB"
-        noun_pos = ["NOUN", "PROPN"]
-    else:
+    if lang not in CONNECTOR_RULES:
         return False, False
+    connectors, det_pron_deps = CONNECTOR_RULES[lang]
     
-    if token.text.lower() not in connectors:
+    word = token.text.lower()
+    if word not in connectors:
         return False, False
     
-    if lang == "en" and token.text.lower() == "that":
-        if token.dep_ == mark_dep and token.head.pos_ == verb_pos:
+    if lang == "en" and word == "that":
+        if token.dep_ == MARK_DEP and token.head.pos_ == VERB_POS:
             return True, False
         else:
             return False, False
-    elif token.dep_ in det_pron_deps and token.head.pos_ in noun_pos:
+    elif token.dep_ in det_pron_deps and token.head.pos_ in NOUN_POS:
         return False, False
     else:
         return True, False
 
-def split_by_connectors(text, context_words=5, nlp=None):
-    doc = nlp(text)
-    sentences = [doc.text]  # init
+def split_by_connectors(sentence, context_words=5):
+    """
+    Split one sentence span before connectors in a single pass, returning sub-spans of the same doc.
+    The left context of each candidate only reaches back to the previous cut, which gives the same cuts
+    as cutting once per round and rescanning every piece until nothing changes.
+    """
+    doc, start, end = sentence.doc, sentence.start, sentence.end
+    sentences = []
     
-    while True:
-        # Handle each task with a single cut
-        # avoiding the fragmentation of a sentence into multiple parts at the same time.
-        split_occurred = False
-        new_sentences = []
+    for token in sentence:
+        if token.i + 1 < end and doc[token.i + 1].text in CONTRACTIONS:
+            continue
         
-        for sent in sentences:
-            doc = nlp(sent)
-            start = 0
-            
-            for i, token in enumerate(doc):
-                split_before, _ = analyze_connectors(doc, token)
-                
-                if i + 1 < len(doc) and doc[i + 1].text in ["'s", "'re", "'ve", "'ll", "'d"]:
-                    continue
-                
-                left_words = doc[max(0, token.i - context_words):token.i]
-                right_words = doc[token.i+1:min(len(doc), token.i + context_words + 1)]
-                
-                left_words = [word.text for word in left_words if not word.is_punct]
-                right_words = [word.text for word in right_words if not word.is_punct]
-                
-                if len(left_words) >= context_words and len(right_words) >= context_words and split_before:
-                    print(f"[yellow]✂️  Split before '{token.text}': {' '.join(left_words)}| {token.text} {' '.join(right_words)}[/yellow]")
-                    new_sentences.append(doc[start:token.i].text.strip())
-                    start = token.i
-                    split_occurred = True
-                    break
-            
-            if start < len(doc):
-                new_sentences.append(doc[start:].text.strip())
+        split_before, _ = analyze_connectors(doc, token)
+        if not split_before:
+            continue
         
-        if not split_occurred:
-            break
+        left_words = [word.text for word in doc[max(start, token.i - context_words):token.i] if not word.is_punct]
+        right_words = [word.text for word in doc[token.i+1:min(end, token.i + context_words + 1)] if not word.is_punct]
         
-        sentences = new_sentences
+        if len(left_words) >= context_words and len(right_words) >= context_words:
+            print(f"[yellow]✂️  Split before '{token.text}': {' '.join(left_words)}| {token.text} {' '.join(right_words)}[/yellow]")
+            sentences.append(doc[start:token.i])
+            start = token.i
+    
+    if start < end:
+        sentences.append(doc[start:end])
     
     return sentences
 
-def split_sentences_main(nlp):
-    # Read input sentences
-    with open("output/log/sentence_by_comma.txt", "r", encoding="utf-8") as input_file:
-        sentences = input_file.readlines()
-    
+def split_sentences_main(sentences):
     all_split_sentences = []
     # Process each input sentence
     for sentence in sentences:
-        split_sentences = split_by_connectors(sentence.strip(), nlp = nlp)
-        all_split_sentences.extend(split_sentences)
-    
-    # output to sentence_splitbyconnector.txt
-    with open("output/log/sentence_splitbyconnector.txt", "w+", encoding="utf-8") as output_file:
-        for sentence in all_split_sentences:
-            output_file.write(sentence + "\n")
-        # do not add a newline at the end of the file
-        output_file.seek(output_file.tell() - 1, os.SEEK_SET)
-        output_file.truncate()
-
-    # delete the original file
-    os.remove("output/log/sentence_by_comma.txt")
+        all_split_sentences.extend(split_by_connectors(sentence))
     
-    print("[green]💾 Sentences split by connectors saved to →  `sentence_splitbyconnector.txt`[/green]")
+    return all_split_sentences
 
 if __name__ == "__main__":
+    from core.spacy_utils.load_nlp_model import init_nlp, dump_sentences
+    from core.spacy_utils.split_by_mark import split_by_mark
+    from core.spacy_utils.split_by_comma import split_by_comma_main
     nlp = init_nlp()
-    split_sentences_main(nlp)
+    dump_sentences(split_sentences_main(split_by_comma_main(split_by_mark(nlp))), "output/log/sentence_splitbyconnector.txt")
     # nlp = init_nlp()
     # a = "and show the specific differences that make a difference between a breakaway that results in a goal in the NHL versus one that doesn't."
-    # print(split_by_connectors(a, nlp))
\ No newline at end of file
+    # print([span.text for span in split_by_connectors(nlp(a)[:])])
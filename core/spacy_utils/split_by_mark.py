@@ -1,47 +1,121 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 import os,sys
-import pandas as pd
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from core.spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.load_nlp_model import init_nlp, dump_sentences, pipe_settings
 from core.config_utils import load_key, get_joiner
+from core.intermediate_store import load_table
 from rich import print
+import numpy as np
 
 """
-利用 NLP 处理文本，按标点符号（句号、逗号等）拆分句子，并存储结果：
+利用 NLP 处理文本，按标点符号（句号、逗号等）拆分句子：
     支持多种语言（自动检测或手动设置）。
-    清理 Excel 数据（去除双引号和空格）。
     使用 NLP 模型分句（确保句子边界）。
+    长文本按重叠窗口流式送入 nlp.pipe，每个位置的句子边界只由“核心区”覆盖它的窗口决定，两侧都有 overlap_chars 的上下文，窗口之间边界稳定。
+    逐窗口产出句子 Span，处理完即可丢弃对应的 Doc，峰值内存与转录长度无关。
     处理标点符号合并问题（适用于中文、日文）。
-    输出至文件，并在终端给出提示。
 """
 
-def split_by_mark(nlp):
+PUNCT_ONLY = [',', '.', '，', '。', '？', '！']
+
+class ParsedWindow:
+    """A parsed window; `offset` / `end` are the transcript character range of its text, `cut` the start of the next word"""
+    def __init__(self, doc, offset, end, cut):
+        self.doc, self.offset, self.end, self.cut = doc, offset, end, cut
+
+    def span(self, start, end):
+        start, end = max(start - self.offset, 0), min(end - self.offset, len(self.doc.text))
+        return self.doc.char_span(start, end, alignment_mode="expand") if start < end else None
+
+def window_ranges(offsets, total_chars, window_chars, overlap_chars):
+    """(window start, core start, core end, window end) word indices; cores tile the transcript, windows add overlap on both sides"""
+    n = len(offsets)
+    cores = np.unique(np.searchsorted(offsets, np.arange(0, total_chars, window_chars)))
+    cores = np.append(cores[cores < n], n)
+    for core_start, core_end in zip(cores[:-1], cores[1:]):
+        core_end_char = offsets[core_end] if core_end < n else total_chars
+        window_start = np.searchsorted(offsets, offsets[core_start] - overlap_chars)
+        window_end = max(core_end, np.searchsorted(offsets, core_end_char + overlap_chars))
+        yield int(window_start), int(core_start), int(core_end), int(window_end)
+
+def _close(prev, cur, start, end):
+    """(start, span) pieces covering [start, end), taken from the window holding it, cut at the previous window's end if neither does"""
+    if start >= cur.offset:
+        return [(start, cur.span(start, end))]
+    if end <= prev.end:
+        return [(start, prev.span(start, end))]
+    return [(start, prev.span(start, prev.cut)), (prev.cut, cur.span(prev.cut, end))]
+
+def iter_sentences_by_mark(nlp):
+    """Yield the sentence spans window by window"""
     whisper_language = load_key("whisper.language")
     language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
     joiner = get_joiner(language)
     print(f"[blue]🔍 Using {language} language joiner: '{joiner}'[/blue]")
-    chunks = pd.read_excel("output/log/cleaned_chunks.xlsx")
-    chunks.text = chunks.text.apply(lambda x: x.strip('"').strip(""))
-    
-    # join with joiner
-    input_text = joiner.join(chunks.text.to_list())
-
-    doc = nlp(input_text)
-    assert doc.has_annotation("SENT_START")
-
-    sentences_by_mark = [sent.text for sent in doc.sents]
-
-    with open("output/log/sentence_by_mark.txt", "w", encoding="utf-8") as output_file:
-        for i, sentence in enumerate(sentences_by_mark):
-            if i > 0 and sentence.strip() in [',', '.', '，', '。', '？', '！']:
-                # ! If the current line contains only punctuation, merge it with the previous line, this happens in Chinese, Japanese, etc.
-                output_file.seek(output_file.tell() - 1, os.SEEK_SET)  # Move to the end of the previous line
-                output_file.write(sentence)  # Add the punctuation
-            else:
-                output_file.write(sentence + "\n")
-    
-    print("[green]💾 Sentences split by punctuation marks saved to →  `sentences_by_mark.txt`[/green]")
+    words = load_table('cleaned_chunks').text.to_list()
+    if not words:
+        return
+
+    # character offset of every word in the joined transcript, which is never built as one string
+    lengths = np.array([len(word) for word in words], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths + len(joiner))[:-1]])
+    total_chars = int(offsets[-1] + lengths[-1])
+    pipe_set = load_key("spacy_pipe")
+    ranges = window_ranges(offsets, total_chars, pipe_set["window_chars"], pipe_set["overlap_chars"])
+    texts = ((joiner.join(words[ws:we]), (ws, cs, ce, we)) for ws, cs, ce, we in ranges)
+
+    prev, held, held_start, start = None, None, 0, 0
+    for doc, (ws, cs, ce, we) in nlp.pipe(texts, as_tuples=True, **pipe_settings(nlp)):
+        assert doc.has_annotation("SENT_START")
+        offset = int(offsets[ws])
+        cur = ParsedWindow(doc, offset, offset + len(doc.text), int(offsets[we]) if we < len(words) else total_chars)
+        core_start, core_end = int(offsets[cs]), (int(offsets[ce]) if ce < len(words) else total_chars)
+        # sentence starts this window is responsible for, the transcript end closes the last sentence
+        # (the window's own first token always starts a sentence, that is no decision)
+        boundaries = [offset + sent.start_char for sent in doc.sents
+                      if core_start <= offset + sent.start_char < core_end and (sent.start_char > 0 or offset == 0)]
+        if ce == len(words):
+            boundaries.append(total_chars)
+
+        sentences = []
+        for boundary in boundaries:
+            if boundary <= start:
+                continue
+            for piece_start, span in _close(prev, cur, start, boundary):
+                if span is None:
+                    continue
+                live = held is not None and (held.doc is cur.doc or (prev is not None and held.doc is prev.doc))
+                if live and span.text.strip() in PUNCT_ONLY:
+                    # ! If the current sentence contains only punctuation, merge it with the previous one, this happens in Chinese, Japanese, etc.
+                    merged = _close(prev, cur, held_start, boundary)
+                    if len(merged) == 1:
+                        held = merged[0][1]
+                        continue
+                if held is not None:
+                    sentences.append(held)
+                held, held_start = span, piece_start
+            start = boundary
+
+        # a sentence still open from before this window would fall out of the next one, cut it here
+        if start < cur.offset and ce < len(words):
+            span = prev.span(start, prev.cut)
+            if span is not None:
+                if held is not None:
+                    sentences.append(held)
+                held, held_start = span, start
+            start = prev.cut
+        prev = cur
+        if sentences:
+            yield sentences
+    if held is not None:
+        yield [held]
+
+def split_by_mark(nlp):
+    """All sentence spans at once, for running the split stages by hand"""
+    sentences = [sentence for sentences in iter_sentences_by_mark(nlp) for sentence in sentences]
+    dump_sentences(sentences, "output/log/sentence_by_mark.txt")
+    return sentences
 
 if __name__ == "__main__":
     nlp = init_nlp()
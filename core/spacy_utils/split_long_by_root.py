@@ -3,17 +3,20 @@ warnings.filterwarnings("ignore", category=FutureWarning)
 import os,sys
 sys.path.append(os.path.abspath(os.path.join(__file__, '..', '..', '..')))
 from core.spacy_utils.load_nlp_model import init_nlp
-from core.config_utils import load_key, get_joiner
 from rich import print
 import string
 
 """
 按句子主干（Root）拆分长句。
+    长度直接取自共享 Doc 上 Span 的 token 数，拆出的片段也是 Span，不再逐句重新解析。
+    SplitWriter 边产出边追加写入最终的 sentence_splitbynlp.txt。
 """
 
-def split_long_sentence(doc):
-    tokens = [token.text for token in doc]
-    n = len(tokens)
+SPLIT_FILE = "output/log/sentence_splitbynlp.txt"
+PUNCTUATION = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
+
+def split_long_sentence(sentence):
+    n = len(sentence)
     
     # dynamic programming array, dp[i] represents the optimal split scheme from the start to the ith token
     dp = [float('inf')] * (n + 1)
@@ -25,7 +28,7 @@ def split_long_sentence(doc):
     for i in range(1, n + 1):
         for j in range(max(0, i - 100), i):  # limit search range to avoid overly long sentences
             if i - j >= 30:  # ensure sentence length is at least 30
-                token = doc[i-1]
+                token = sentence[i-1]
                 if j == 0 or (token.is_sent_end or token.pos_ in ['VERB', 'AUX'] or token.dep_ == 'ROOT'):
                     if dp[j] + 1 < dp[i]:
                         dp[i] = dp[j] + 1
@@ -34,77 +37,81 @@ def split_long_sentence(doc):
     # rebuild sentences based on optimal split points
     sentences = []
     i = n
-    whisper_language = load_key("whisper.language")
-    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
-    joiner = get_joiner(language)
     while i > 0:
         j = prev[i]
-        sentences.append(joiner.join(tokens[j:i]).strip())
+        sentences.append(sentence[j:i])
         i = j
     
     return sentences[::-1]  # reverse list to keep original order
 
-def split_extremely_long_sentence(doc):
-    tokens = [token.text for token in doc]
-    n = len(tokens)
+def split_extremely_long_sentence(sentence):
+    n = len(sentence)
     
     num_parts = (n + 59) // 60  # round up
     
     part_length = n // num_parts
     
     sentences = []
-    whisper_language = load_key("whisper.language")
-    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
-    joiner = get_joiner(language)
     for i in range(num_parts):
         start = i * part_length
         end = start + part_length if i < num_parts - 1 else n
-        sentence = joiner.join(tokens[start:end])
-        sentences.append(sentence)
+        sentences.append(sentence[start:end])
     
     return sentences
 
 
 
-def split_long_by_root_main(nlp):
-
-    with open("output/log/sentence_splitbyconnector.txt", "r", encoding="utf-8") as input_file:
-        sentences = input_file.readlines()
-
+def split_long_by_root_main(sentences):
     all_split_sentences = []
     for sentence in sentences:
-        doc = nlp(sentence.strip())
-        if len(doc) > 60:
-            split_sentences = split_long_sentence(doc)
-            if any(len(nlp(sent)) > 60 for sent in split_sentences):
-                split_sentences = [subsent for sent in split_sentences for subsent in split_extremely_long_sentence(nlp(sent))]
-            all_split_sentences.extend(split_sentences)
-            print(f"[yellow]✂️  Splitting long sentences by root: {sentence[:30]}...[/yellow]")
+        if len(sentence) > 60:
+            split_sentences = split_long_sentence(sentence)
+            if any(len(sent) > 60 for sent in split_sentences):
+                split_sentences = [subsent for sent in split_sentences for subsent in split_extremely_long_sentence(sent)]
+            all_split_sentences.extend(sent.text.strip() for sent in split_sentences)
+            print(f"[yellow]✂️  Splitting long sentences by root: {sentence.text[:30]}...[/yellow]")
         else:
-            all_split_sentences.append(sentence.strip())
-
-    punctuation = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
+            all_split_sentences.append(sentence.text.strip())
+    return all_split_sentences
 
-    with open("output/log/sentence_splitbynlp.txt", "w", encoding="utf-8") as output_file:
-        for i, sentence in enumerate(all_split_sentences):
-            stripped_sentence = sentence.strip()
-            if not stripped_sentence or all(char in punctuation for char in stripped_sentence):
-                print(f"[yellow]⚠️  Warning: Empty or punctuation-only line detected at index {i}[/yellow]")
-                if i > 0:
-                    all_split_sentences[i-1] += sentence
-                continue
-            output_file.write(sentence + "\n")
+class SplitWriter:
+    """Appends the final lines as they are produced, merging empty or punctuation-only lines into the previous one"""
+    def __init__(self, path: str = SPLIT_FILE):
+        self.path = path
+        # written under a temporary name so an interrupted run never looks finished
+        self.output_file = open(path + ".tmp", "w", encoding="utf-8")
+        self.last_line = None
+        self.index = 0
 
-    # delete the original file
-    os.remove("output/log/sentence_splitbyconnector.txt")   
+    def write(self, lines):
+        for line in lines:
+            if not line or all(char in PUNCTUATION for char in line):
+                print(f"[yellow]⚠️  Warning: Empty or punctuation-only line detected at index {self.index}[/yellow]")
+                if self.last_line is not None:
+                    self.last_line += line
+            else:
+                if self.last_line is not None:
+                    self.output_file.write(self.last_line + "\n")
+                self.last_line = line
+            self.index += 1
 
-    print("[green]💾 Long sentences split by root saved to →  `sentence_splitbynlp.txt`[/green]")
+    def close(self):
+        if self.last_line is not None:
+            self.output_file.write(self.last_line + "\n")
+        self.output_file.close()
+        os.replace(self.path + ".tmp", self.path)
+        print(f"[green]💾 Long sentences split by root saved to →  `{os.path.basename(self.path)}`[/green]")
 
 if __name__ == "__main__":
+    from core.spacy_utils.split_by_mark import split_by_mark
+    from core.spacy_utils.split_by_comma import split_by_comma_main
+    from core.spacy_utils.split_by_connector import split_sentences_main
     nlp = init_nlp()
-    split_long_by_root_main(nlp)
+    writer = SplitWriter()
+    writer.write(split_long_by_root_main(split_sentences_main(split_by_comma_main(split_by_mark(nlp)))))
+    writer.close()
     # raw = "平口さんの盛り上げごまが初めて売れました本当に嬉しいです本当にやっぱり見た瞬間いいって言ってくれるそういうコマを作るのがやっぱりいいですよねその2ヶ月後チコさんが何やらそわそわしていましたなんか気持ち悪いやってきたのは平口さんの駒の評判を聞きつけた愛知県の収集家ですこの男性師匠大沢さんの駒も持っているといいますちょっと褒めすぎかなでも確実にファンは広がっているようです自信がない部分をすごく感じてたのでこれで自信を持って進んでくれるなっていう本当に始まったばっかりこれからいろいろ挑戦していってくれるといいなと思って今月平口さんはある場所を訪れましたこれまで数々のタイトル戦でコマを提供してきた老舗5番手平口さんのコマを扱いたいと言いますいいですねぇ困ってだんだん成長しますので大切に使ってそういう長く良い駒になる駒ですね商談が終わった後店主があるものを取り出しましたこの前の名人戦で使った駒があるんですけど去年、名人銭で使われた盛り上げごま低く盛り上げて品良くするというのは難しい素晴らしいですね平口さんが目指す高みですこういった感じで作れればまだまだですけどただ、多分、咲く。"
     # nlp = init_nlp()
     # doc = nlp(raw.strip())
-    # for sent in split_still_long_sentence(doc):
-    #     print(sent, '\n==========')
+    # for sent in split_extremely_long_sentence(doc[:]):
+    #     print(sent.text, '\n==========')
@@ -1,11 +1,11 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import pandas as pd
 import subprocess
 from pydub import AudioSegment
 from rich import print as rprint
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
 from rich.console import Console
+from core.intermediate_store import load_table
 
 """
 音频合成
@@ -17,21 +17,17 @@ step12_merge_dub_to_vid.py：将配音合成到视频。
 
 console = Console()
 
-INPUT_EXCEL = 'output/audio/tts_tasks.xlsx'
 DUB_VOCAL_FILE = 'output/dub.mp3'
 
 DUB_SUB_FILE = 'output/dub.srt'
 SEGS_DIR = 'output/audio/segs'
 OUTPUT_FILE_TEMPLATE = f"{SEGS_DIR}/{{}}.wav"
 
-def load_and_flatten_data(excel_file):
-    """Load and flatten Excel data"""
-    df = pd.read_excel(excel_file)
-    lines = [eval(line) if isinstance(line, str) else line for line in df['lines'].tolist()]
-    lines = [item for sublist in lines for item in sublist]
-    
-    new_sub_times = [eval(time) if isinstance(time, str) else time for time in df['new_sub_times'].tolist()]
-    new_sub_times = [item for sublist in new_sub_times for item in sublist]
+def load_and_flatten_data():
+    """Load the tts task table and flatten its list columns"""
+    df = load_table('tts_tasks')
+    lines = [item for sublist in df['lines'] for item in sublist]
+    new_sub_times = [item for sublist in df['new_sub_times'] for item in sublist]
     
     return df, lines, new_sub_times
 
@@ -40,7 +36,7 @@ def get_audio_files(df):
     audios = []
     for index, row in df.iterrows():
         number = row['number']
-        line_count = len(eval(row['lines']) if isinstance(row['lines'], str) else row['lines'])
+        line_count = len(row['lines'])
         for line_index in range(line_count):
             temp_file = OUTPUT_FILE_TEMPLATE.format(f"{number}_{line_index}")
             audios.append(temp_file)
@@ -99,7 +95,7 @@ def merge_audio_segments(audios, new_sub_times, sample_rate):
     return merged_audio
 
 def create_srt_subtitle():
-    df, lines, new_sub_times = load_and_flatten_data(INPUT_EXCEL)
+    df, lines, new_sub_times = load_and_flatten_data()
     
     with open(DUB_SUB_FILE, 'w', encoding='utf-8') as f:
         for i, ((start_time, end_time), line) in enumerate(zip(new_sub_times, lines), 1):
@@ -117,7 +113,7 @@ def merge_full_audio():
     console.print("\n[bold cyan]🎬 Starting audio merging process...[/bold cyan]")
     
     with console.status("[bold cyan]📊 Loading data from Excel...[/bold cyan]"):
-        df, lines, new_sub_times = load_and_flatten_data(INPUT_EXCEL)
+        df, lines, new_sub_times = load_and_flatten_data()
     console.print("[bold green]✅ Data loaded successfully[/bold green]")
     
     with console.status("[bold cyan]🔍 Getting audio file list...[/bold cyan]"):
@@ -2,80 +2,184 @@ import os,sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from rich import print as rprint
-import subprocess
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from core.config_utils import load_key
 from core.all_whisper_methods.demucs_vl import demucs_main, RAW_AUDIO_FILE, VOCAL_AUDIO_FILE
-from core.all_whisper_methods.audio_preprocess import process_transcription, convert_video_to_audio, split_audio, save_results, compress_audio, CLEANED_CHUNKS_EXCEL_PATH
+from core.all_whisper_methods.audio_preprocess import process_transcription, convert_video_to_audio, split_audio, save_results
 from core.step1_ytdlp import find_video_files
+from core.all_whisper_methods.audio_decode import release_audio_buffers, load_audio_buffer, PCM_FILE
+from core.intermediate_store import table_exists
 
 """
 使用 WhisperX 进行语音识别。
 """
 
-WHISPER_FILE = "output/audio/for_whisper.mp3"
-ENHANCED_VOCAL_PATH = "output/audio/enhanced_vocals.mp3"
+DECODE_AHEAD = 2  # decoded segments waiting for ASR at most
+THROUGHPUT_FILE = "output/log/transcribe_throughput.json"
 
 def enhance_vocals(vocals_ratio=2.50):
-    """Enhance vocals audio volume"""
+    """Enhance vocals audio volume while decoding them to the ASR PCM, no intermediate mp3"""
     if not load_key("demucs"):
         return RAW_AUDIO_FILE
         
-    try:
-        print(f"[cyan]🎙️ Enhancing vocals with volume ratio: {vocals_ratio}[/cyan]")
-        ffmpeg_cmd = (
-            f'ffmpeg -y -i "{VOCAL_AUDIO_FILE}" '
-            f'-filter:a "volume={vocals_ratio}" '
-            f'"{ENHANCED_VOCAL_PATH}"'
-        )
-        subprocess.run(ffmpeg_cmd, shell=True, check=True, capture_output=True)
-        
-        return ENHANCED_VOCAL_PATH
-    except subprocess.CalledProcessError as e:
-        print(f"[red]Error enhancing vocals: {str(e)}[/red]")
-        return VOCAL_AUDIO_FILE  # Fallback to original vocals if enhancement fails
+    rprint(f"[cyan]🎙️ Enhancing vocals with volume ratio: {vocals_ratio}[/cyan]")
+    load_audio_buffer(VOCAL_AUDIO_FILE, audio_filter=f"volume={vocals_ratio}")
+    return VOCAL_AUDIO_FILE
     
+def _decode_ahead(whisper_audio, segments, load_segment, out_queue, stop):
+    """Producer: decode segments in order into a bounded queue, None marks the end"""
+    def put(item):
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for start, end in segments:
+            if not put((start, end, load_segment(whisper_audio, start, end))):
+                return
+    except Exception as e:
+        put(e)
+    put(None)
+
+def stream_local_transcription(whisper_audio, segments):
+    """
+    Yield aligned results segment by segment:
+    decoding runs ahead in a thread, ASR consumes decoded arrays, and alignment of segment N overlaps ASR of N+1.
+    """
+    from core.all_whisper_methods.whisperX_local import load_audio_segment, transcribe_segment, align_segment, prepare_language
+    # pick the model before any segment is transcribed
+    language = prepare_language(whisper_audio, segments)
+    decoded = queue.Queue(maxsize=DECODE_AHEAD)
+    stop = threading.Event()
+    producer = threading.Thread(target=_decode_ahead, args=(whisper_audio, segments, load_audio_segment, decoded, stop), daemon=True)
+    producer.start()
+    pending = None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as aligner:
+            while True:
+                item = decoded.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                start, end, audio_segment = item
+                result = transcribe_segment(audio_segment, start, end, language=language)
+                if pending is not None:
+                    yield pending.result()
+                pending = aligner.submit(align_segment, result, audio_segment, start)
+            if pending is not None:
+                yield pending.result()
+    finally:
+        stop.set()
+
+def use_cpu_parallel() -> bool:
+    """Only worth it without CUDA and with enough cores for more than one worker"""
+    import torch
+    if load_key("whisper.runtime") != "local" or not load_key("whisper_cpu_parallel.enabled") or torch.cuda.is_available():
+        return False
+    from core.all_whisper_methods.whisperX_local import cpu_parallel_settings
+    workers, _ = cpu_parallel_settings(os.cpu_count() or 1)
+    if workers < 2:
+        rprint("[yellow]⚠️ whisper_cpu_parallel: not enough cores for more than one worker, transcribing sequentially[/yellow]")
+        return False
+    return True
+
+def parallel_cpu_transcription(whisper_audio, segments):
+    """Transcribe segments in a process pool on CPU and yield the aligned results back in segment order"""
+    from core.all_whisper_methods.whisperX_local import cpu_parallel_settings, _init_cpu_worker, _transcribe_in_worker, prepare_language
+    workers, threads = cpu_parallel_settings(len(segments))
+    rprint(f"[cyan]🧵 CPU transcription with {workers} workers x {threads} threads[/cyan]")
+    # decode once in the parent so workers only memory-map the PCM
+    load_audio_buffer(whisper_audio)
+    # workers load their own alignment model, the parent only probes the language
+    language = prepare_language(whisper_audio, segments, preload_align=False)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_cpu_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(_transcribe_in_worker, whisper_audio, start, end, threads, language) for start, end in segments]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+def report_throughput(mode: str, audio_seconds: float, wall_seconds: float):
+    """Print audio-seconds per wall-second and compare with the last recorded run of the other modes, if any"""
+    history = {}
+    if os.path.exists(THROUGHPUT_FILE):
+        with open(THROUGHPUT_FILE, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    speed = audio_seconds / wall_seconds if wall_seconds else 0
+    rprint(f"[bold green]⏱️ Transcription ({mode}): {audio_seconds:.0f}s audio in {wall_seconds:.0f}s, {speed:.2f} audio-sec/wall-sec[/bold green]")
+    baselines = {other: stats for other, stats in history.items() if other != mode and stats["speed"]}
+    for other, stats in baselines.items():
+        rprint(f"[cyan]   vs {other}: {stats['speed']:.2f} audio-sec/wall-sec ({speed / stats['speed']:.2f}x)[/cyan]")
+    if not baselines:
+        rprint(f"[cyan]   No baseline to compare with yet: nothing recorded for another mode in {THROUGHPUT_FILE}, "
+               f"the comparison appears once a run uses a different mode (e.g. whisper_cpu_parallel.enabled toggled)[/cyan]")
+    history[mode] = {"audio_seconds": audio_seconds, "wall_seconds": wall_seconds, "speed": speed}
+    os.makedirs(os.path.dirname(THROUGHPUT_FILE), exist_ok=True)
+    with open(THROUGHPUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=4)
+
+def stream_302_transcription(whisper_audio, segments):
+    from core.all_whisper_methods.whisperX_302 import transcribe_segments_302
+    yield from transcribe_segments_302(whisper_audio, segments)
+
 def transcribe():
-    if os.path.exists(CLEANED_CHUNKS_EXCEL_PATH):
+    if table_exists("cleaned_chunks"):
         rprint("[yellow]⚠️ Transcription results already exist, skipping transcription step.[/yellow]")
         return
     
-    # step0 Convert video to audio
+    # step0 Decode the video once: raw.mp3, plus the ASR PCM directly when there is no vocal separation
     video_file = find_video_files()
-    convert_video_to_audio(video_file)
+    use_demucs = load_key("demucs")
+    convert_video_to_audio(video_file, pcm_file=None if use_demucs else PCM_FILE)
 
     # step1 Demucs vocal separation:
-    if load_key("demucs"):
+    if use_demucs:
         demucs_main()
     
-    # step2 Compress audio
-    choose_audio = enhance_vocals() if load_key("demucs") else RAW_AUDIO_FILE
-    whisper_audio = compress_audio(choose_audio, WHISPER_FILE)
+    # step2 ASR audio, decoded straight to 16kHz PCM (vocals boosted on the way)
+    whisper_audio = enhance_vocals()
 
-    # step3 Extract audio
-    segments = split_audio(whisper_audio)
+    # step3 Extract audio, shorter segments on CPU so every worker gets work
+    cpu_parallel = use_cpu_parallel()
+    if cpu_parallel:
+        segment_len = load_key("whisper_cpu_parallel.segment_len")
+        segments = split_audio(whisper_audio, target_len=segment_len, win=max(5, segment_len // 10))
+    else:
+        segments = split_audio(whisper_audio)
     
-    # step4 Transcribe audio
-    all_results = []
-    if load_key("whisper.runtime") == "local":
-        from core.all_whisper_methods.whisperX_local import transcribe_audio as ts
+    # step4 Transcribe audio, results stream into step5 as each segment finishes
+    start_time = time.time()
+    if cpu_parallel:
+        mode = "local-cpu-parallel"
+        rprint("[cyan]🎤 Transcribing audio with local model on CPU workers...[/cyan]")
+        results = parallel_cpu_transcription(whisper_audio, segments)
+    elif load_key("whisper.runtime") == "local":
+        mode = "local-serial"
         rprint("[cyan]🎤 Transcribing audio with local model...[/cyan]")
+        results = stream_local_transcription(whisper_audio, segments)
     else:
-        from core.all_whisper_methods.whisperX_302 import transcribe_audio_302 as ts
+        mode = "302"
         rprint("[cyan]🎤 Transcribing audio with 302 API...[/cyan]")
-
-    for start, end in segments:
-        result = ts(whisper_audio, start, end)
-        all_results.append(result)
-    
-    # step5 Combine results
-    combined_result = {'segments': []}
-    for result in all_results:
-        combined_result['segments'].extend(result['segments'])
+        results = stream_302_transcription(whisper_audio, segments)
     
-    # step6 Process df
-    df = process_transcription(combined_result)
+    # step5 Process df
+    df = process_transcription(results)
+    report_throughput(mode, sum(end - start for start, end in segments), time.time() - start_time)
     save_results(df)
+    # the decoded PCM is only needed during transcription, don't carry it into history
+    release_audio_buffers(remove_files=True)
         
 if __name__ == "__main__":
     transcribe()
\ No newline at end of file
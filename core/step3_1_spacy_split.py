@@ -1,28 +1,65 @@
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from spacy_utils.split_by_comma import split_by_comma_main
-from spacy_utils.split_by_connector import split_sentences_main
-from spacy_utils.split_by_mark import split_by_mark
-from spacy_utils.split_long_by_root import split_long_by_root_main
-from spacy_utils.load_nlp_model import init_nlp
+# every splitter is imported through core.spacy_utils, the same load_nlp_model module step3_2 imports,
+# so there is one process-wide model registry
+from core.spacy_utils.split_by_comma import split_by_comma_main
+from core.spacy_utils.split_by_connector import split_sentences_main
+from core.spacy_utils.split_by_mark import iter_sentences_by_mark
+from core.spacy_utils.split_long_by_root import split_long_by_root_main, SplitWriter, SPLIT_FILE
+from core.spacy_utils.load_nlp_model import init_nlp, dump_sentences, report_stage
 
 """
 使用 SpaCy 按语法结构拆分字幕。
+    转录文本按窗口解析，每个窗口的句子 Span 依次经过逗号、连接词、长句拆分，结果立即追加写入，随后丢弃该窗口。
 """
 
+MARK_STAGE = "Split by punctuation marks"
+MARK_DUMP = "output/log/sentence_by_mark.txt"
+# (name, stage, debug dump)
+STAGES = [
+    ("Split by commas", split_by_comma_main, "output/log/sentence_by_comma.txt"),
+    ("Split by connectors", split_sentences_main, "output/log/sentence_splitbyconnector.txt"),
+    ("Split long sentences by root", split_long_by_root_main, None),
+]
+
 def split_by_spacy():
-    if os.path.exists('output/log/sentence_splitbynlp.txt'):
+    if os.path.exists(SPLIT_FILE):
         print("File 'sentence_splitbynlp.txt' already exists. Skipping split_by_spacy.")
         return
     
     nlp = init_nlp()
-    split_by_mark(nlp)
-    split_by_comma_main(nlp)
-    split_sentences_main(nlp)
-    split_long_by_root_main(nlp)
+    # name -> [sentences in, sentences out, seconds]
+    stats = {name: [0, 0, 0.0] for name in [MARK_STAGE] + [stage[0] for stage in STAGES]}
+    writer = SplitWriter()
+    batches = iter_sentences_by_mark(nlp)
+    first = True
+    while True:
+        start_time = time.time()
+        sentences = next(batches, None)
+        stats[MARK_STAGE][2] += time.time() - start_time
+        if sentences is None:
+            break
+        stats[MARK_STAGE][1] += len(sentences)
+        dump_sentences(sentences, MARK_DUMP, append=not first)
+
+        for name, stage, dump_path in STAGES:
+            start_time = time.time()
+            stats[name][0] += len(sentences)
+            sentences = stage(sentences)
+            stats[name][1] += len(sentences)
+            stats[name][2] += time.time() - start_time
+            if dump_path:
+                dump_sentences(sentences, dump_path, append=not first)
+        writer.write(sentences)
+        first = False
+    writer.close()
+
+    for name, (sentences_in, sentences_out, seconds) in stats.items():
+        report_stage(name, None if name == MARK_STAGE else sentences_in, sentences_out, seconds)
     return
 
 if __name__ == '__main__':
-    split_by_spacy()
\ No newline at end of file
+    split_by_spacy()
@@ -1,12 +1,10 @@
 import sys,os,math
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import concurrent.futures
-from core.ask_gpt import ask_gpt
+from core.ask_gpt import ask_gpt, ask_gpt_many
 from core.prompts_storage import get_split_prompt
-from difflib import SequenceMatcher
 import math
 from core.spacy_utils.load_nlp_model import init_nlp
-from core.config_utils import load_key, get_joiner
+from core.config_utils import load_key
 from rich.console import Console
 from rich.table import Table
 
@@ -16,55 +14,116 @@ from rich.table import Table
 
 console = Console()
 
+SPLIT_ALIGN_BAND = 32  # allowed drift (chars) of the alignment path off the diagonal
+CONFIDENCE_WINDOW = 10  # chars on each side of a split used to score it
+MIN_SPLIT_CONFIDENCE = 0.9
+
 def tokenize_sentence(sentence, nlp):
     # tokenizer counts the number of words in the sentence
     doc = nlp(sentence)
     return [token.text for token in doc]
 
+def _normalize(text):
+    """Lowercased non-space chars of `text`, plus the index of each one in `text`"""
+    chars, index = [], []
+    for i, c in enumerate(text):
+        if not c.isspace():
+            chars.append(c.lower())
+            index.append(i)
+    return ''.join(chars), index
+
+def _align_streams(a, b):
+    """
+    Banded edit-distance alignment of b onto a.
+    Returns (cut, matched): cut[j] is the position in a that lines up with the boundary before b[j],
+    matched[j] tells whether b[j] was aligned to an equal char of a.
+    """
+    n, m = len(a), len(b)
+    band = SPLIT_ALIGN_BAND + abs(n - m)
+    inf = n + m + 1
+    rows = []  # per j: (lo, costs, moves) over the band of i; moves 1=diagonal 2=skip b 3=skip a
+    for j in range(m + 1):
+        center = round(j * n / m) if m else 0
+        lo, hi = max(0, center - band), min(n, center + band)
+        costs, moves = [inf] * (hi - lo + 1), [0] * (hi - lo + 1)
+        prev_lo, prev_costs, _ = rows[j - 1] if j else (0, [], [])
+        prev_hi = prev_lo + len(prev_costs) - 1
+        for i in range(lo, hi + 1):
+            if i == 0 and j == 0:
+                costs[0] = 0
+                continue
+            best, move = inf, 0
+            if j and i and prev_lo <= i - 1 <= prev_hi:
+                best, move = prev_costs[i - 1 - prev_lo] + (a[i - 1] != b[j - 1]), 1
+            if j and prev_lo <= i <= prev_hi and prev_costs[i - prev_lo] + 1 < best:
+                best, move = prev_costs[i - prev_lo] + 1, 2
+            if i > lo and costs[i - 1 - lo] + 1 < best:
+                best, move = costs[i - 1 - lo] + 1, 3
+            costs[i - lo], moves[i - lo] = best, move
+        rows.append((lo, costs, moves))
+
+    cut, matched = [n] * (m + 1), [False] * m
+    i, j = n, m
+    while i > 0 or j > 0:
+        lo, _, moves = rows[j]
+        cut[j] = min(cut[j], i)
+        move = moves[i - lo]
+        if move == 1:
+            matched[j - 1] = a[i - 1] == b[j - 1]
+            i, j = i - 1, j - 1
+        elif move == 2:
+            j -= 1
+        else:
+            i -= 1
+    cut[0] = 0
+    return cut, matched
+
+def align_split_points(original, modified):
+    """
+    Map the `[br]` marks of the GPT output onto `original` in one alignment pass.
+    Returns a list of (split_position, confidence); confidence is the share of matched chars around the split.
+    """
+    parts = modified.split('[br]')
+    orig_norm, orig_index = _normalize(original)
+    part_norms = [_normalize(part)[0] for part in parts]
+    mod_norm = ''.join(part_norms)
+    if not orig_norm or not mod_norm:
+        return []
+
+    cut, matched = _align_streams(orig_norm, mod_norm)
+    results = []
+    boundary = 0
+    for part_norm in part_norms[:-1]:
+        boundary += len(part_norm)
+        norm_pos = cut[boundary]
+        window = matched[max(0, boundary - CONFIDENCE_WINDOW):boundary + CONFIDENCE_WINDOW]
+        confidence = sum(window) / len(window) if window else 0.0
+        position = orig_index[norm_pos] if norm_pos < len(orig_index) else len(original)
+        results.append((position, confidence))
+    return results
+
 def find_split_positions(original, modified):
     split_positions = []
-    parts = modified.split('[br]')
-    start = 0
-    whisper_language = load_key("whisper.language")
-    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
-    joiner = get_joiner(language)
-
-    for i in range(len(parts) - 1):
-        max_similarity = 0
-        best_split = None
-
-        for j in range(start, len(original)):
-            original_left = original[start:j]
-            modified_left = joiner.join(parts[i].split())
-
-            left_similarity = SequenceMatcher(None, original_left, modified_left).ratio()
-
-            if left_similarity > max_similarity:
-                max_similarity = left_similarity
-                best_split = j
-
-        if max_similarity < 0.9:
-            console.print(f"[yellow]Warning: low similarity found at the best split point: {max_similarity}[/yellow]")
-        if best_split is not None:
-            split_positions.append(best_split)
-            start = best_split
+    for i, (position, confidence) in enumerate(align_split_points(original, modified)):
+        if confidence < MIN_SPLIT_CONFIDENCE:
+            console.print(f"[yellow]Warning: low similarity found at the best split point: {confidence:.2f}[/yellow]")
+        # drop splits that would leave an empty line
+        if 0 < position < len(original) and (not split_positions or position > split_positions[-1]):
+            split_positions.append(position)
         else:
             console.print(f"[yellow]Warning: Unable to find a suitable split point for the {i+1}th part.[/yellow]")
 
     return split_positions
 
-def split_sentence(sentence, num_parts, word_limit=18, index=-1, retry_attempt=0):
-    """Split a long sentence using GPT and return the result as a string."""
-    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
-    def valid_split(response_data):
-        if 'split' not in response_data:
-            return {"status": "error", "message": "Missing required key: `split`"}
-        if "[br]" not in response_data["split"]:
-            return {"status": "error", "message": "Split failed, no [br] found"}
-        return {"status": "success", "message": "Split completed"}
-    
-    response_data = ask_gpt(split_prompt + ' ' * retry_attempt, response_json=True, valid_def=valid_split, log_title='sentence_splitbymeaning')
-    best_split = response_data["split"]
+def valid_split(response_data):
+    if 'split' not in response_data:
+        return {"status": "error", "message": "Missing required key: `split`"}
+    if "[br]" not in response_data["split"]:
+        return {"status": "error", "message": "Split failed, no [br] found"}
+    return {"status": "success", "message": "Split completed"}
+
+def apply_split(sentence, best_split, index=-1):
+    """Map the `[br]`-marked GPT output back onto the original sentence, return it with `\n` at the split points."""
     split_points = find_split_positions(sentence, best_split)
     # split the sentence based on the split points
     for i, split_point in enumerate(split_points):
@@ -86,30 +145,40 @@ def split_sentence(sentence, num_parts, word_limit=18, index=-1, retry_attempt=0
     
     return best_split
 
+def split_sentence(sentence, num_parts, word_limit=18, index=-1, retry_attempt=0):
+    """Split a long sentence using GPT and return the result as a string."""
+    split_prompt = get_split_prompt(sentence, num_parts, word_limit)
+    response_data = ask_gpt(split_prompt + ' ' * retry_attempt, response_json=True, valid_def=valid_split, log_title='sentence_splitbymeaning')
+    return apply_split(sentence, response_data["split"], index)
+
+def split_sentences_batch(tasks, retry_attempt=0, max_workers=None):
+    """Split many sentences through one pooled GPT batch. `tasks` holds (sentence, num_parts, word_limit, index) tuples."""
+    prompts = [get_split_prompt(sentence, num_parts, word_limit) + ' ' * retry_attempt for sentence, num_parts, word_limit, _ in tasks]
+    responses = ask_gpt_many(prompts, response_json=True, valid_def=valid_split, log_title='sentence_splitbymeaning', max_concurrency=max_workers)
+    return [apply_split(sentence, response["split"], index) for (sentence, _, _, index), response in zip(tasks, responses)]
+
 def parallel_split_sentences(sentences, max_length, max_workers, nlp, retry_attempt=0):
-    """Split sentences in parallel using a thread pool."""
+    """Split sentences in parallel through the pooled GPT batch API."""
     new_sentences = [None] * len(sentences)
-    futures = []
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for index, sentence in enumerate(sentences):
-            # Use tokenizer to split the sentence
-            tokens = tokenize_sentence(sentence, nlp)
-            # print("Tokenization result:", tokens)
-            num_parts = math.ceil(len(tokens) / max_length)
-            if len(tokens) > max_length:
-                future = executor.submit(split_sentence, sentence, num_parts, max_length, index=index, retry_attempt=retry_attempt)
-                futures.append((future, index, num_parts, sentence))
-            else:
-                new_sentences[index] = [sentence]
-
-        for future, index, num_parts, sentence in futures:
-            split_result = future.result()
-            if split_result:
-                split_lines = split_result.strip().split('\n')
-                new_sentences[index] = [line.strip() for line in split_lines]
-            else:
-                new_sentences[index] = [sentence]
+    tasks = []
+
+    for index, sentence in enumerate(sentences):
+        # Use tokenizer to split the sentence
+        tokens = tokenize_sentence(sentence, nlp)
+        # print("Tokenization result:", tokens)
+        num_parts = math.ceil(len(tokens) / max_length)
+        if len(tokens) > max_length:
+            tasks.append((sentence, num_parts, max_length, index))
+        else:
+            new_sentences[index] = [sentence]
+
+    split_results = split_sentences_batch(tasks, retry_attempt=retry_attempt, max_workers=max_workers)
+    for (sentence, _, _, index), split_result in zip(tasks, split_results):
+        if split_result:
+            split_lines = split_result.strip().split('\n')
+            new_sentences[index] = [line.strip() for line in split_lines]
+        else:
+            new_sentences[index] = [sentence]
 
     return [sentence for sublist in new_sentences for sentence in sublist]
 
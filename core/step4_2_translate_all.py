@@ -6,8 +6,9 @@ import concurrent.futures
 from core.translate_once import translate_lines
 from core.step4_1_summarize import search_things_to_note_in_prompt
 from core.step8_1_gen_audio_task import check_len_then_trim
-from core.step6_generate_final_timeline import align_timestamp
+from core.step6_generate_final_timeline import align_timestamp, load_cleaned_words
 from core.config_utils import load_key
+from core.intermediate_store import save_table, table_exists
 from rich.console import Console
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
@@ -20,9 +21,7 @@ from difflib import SequenceMatcher
 console = Console()
 
 SENTENCE_SPLIT_FILE = "output/log/sentence_splitbymeaning.txt"
-TRANSLATION_RESULTS_FILE = "output/log/translation_results.xlsx"
 TERMINOLOGY_FILE = "output/log/terminology.json"
-CLEANED_CHUNKS_FILE = "output/log/cleaned_chunks.xlsx"
 
 # Function to split text into chunks
 def split_chunks_by_chars(chunk_size=400, max_i=8): 
@@ -65,8 +64,8 @@ def similar(a, b):
 # 🚀 Main function to translate all chunks
 def translate_all():
     # Check if the file exists
-    if os.path.exists(TRANSLATION_RESULTS_FILE):
-        console.print(Panel("🚨 File `translation_results.xlsx` already exists, skipping TRANSLATE ALL.", title="Warning", border_style="yellow"))
+    if table_exists('translation_results'):
+        console.print(Panel("🚨 Translation results already exist, skipping TRANSLATE ALL.", title="Warning", border_style="yellow"))
         return
     
     console.print("[bold green]Start Translating All...[/bold green]")
@@ -94,7 +93,7 @@ def translate_all():
 
     results.sort(key=lambda x: x[0])  # Sort results based on original order
     
-    # 💾 Save results to lists and Excel file
+    # 💾 Save results to lists and the results table
     src_text, trans_text = [], []
     for i, chunk in enumerate(chunks):
         chunk_lines = chunk.split('\n')
@@ -116,17 +115,17 @@ def translate_all():
         trans_text.extend(best_match[0][2].split('\n'))
     
     # Trim long translation text
-    df_text = pd.read_excel(CLEANED_CHUNKS_FILE)
-    df_text['text'] = df_text['text'].str.strip('"').str.strip()
+    df_text, alignment = load_cleaned_words()
     df_translate = pd.DataFrame({'Source': src_text, 'Translation': trans_text})
     subtitle_output_configs = [('trans_subs_for_audio.srt', ['Translation'])]
-    df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False)
+    df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False, alignment=alignment)
     console.print(df_time)
     # apply check_len_then_trim to df_time['Translation'], only when duration > MIN_TRIM_DURATION.
-    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > load_key("min_trim_duration") else x['Translation'], axis=1)
+    min_trim_duration = load_key("min_trim_duration")
+    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration']) if x['duration'] > min_trim_duration else x['Translation'], axis=1)
     console.print(df_time)
     
-    df_time.to_excel(TRANSLATION_RESULTS_FILE, index=False)
+    save_table('translation_results', df_time)
     console.print("[bold green]✅ Translation completed and results saved.[/bold green]")
 
 if __name__ == '__main__':
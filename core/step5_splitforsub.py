@@ -1,13 +1,13 @@
 import sys, os
 import pandas as pd
 from typing import List, Tuple
-import concurrent.futures
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.step3_2_splitbymeaning import split_sentence
-from core.ask_gpt import ask_gpt
+from core.step3_2_splitbymeaning import split_sentences_batch
+from core.ask_gpt import ask_gpt, ask_gpt_many
 from core.prompts_storage import get_align_prompt
 from core.config_utils import load_key, get_joiner
+from core.intermediate_store import load_table, save_table
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
@@ -21,9 +21,6 @@ from rich.table import Table
 console = Console()
 
 # Constants
-INPUT_FILE = "output/log/translation_results.xlsx"
-OUTPUT_SPLIT_FILE = "output/log/translation_results_for_subtitles.xlsx"
-OUTPUT_REMERGED_FILE = "output/log/translation_results_remerged.xlsx"
 
 # ! You can modify your own weights here
 # Chinese and Japanese 2.5 characters, Korean 2 characters, Thai 1.5 characters, full-width symbols 2 characters, other English-based and half-width symbols 1 character
@@ -44,18 +41,14 @@ def calc_len(text: str) -> float:
 
     return sum(char_weight(char) for char in text)
 
-def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
-    align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
-    
-    def valid_align(response_data):
-        if 'align' not in response_data:
-            return {"status": "error", "message": "Missing required key: `align`"}
-        if len(response_data['align']) < 2:
-            return {"status": "error", "message": "Align does not contain more than 1 part as expected!"}
-        return {"status": "success", "message": "Align completed"}
+def valid_align(response_data):
+    if 'align' not in response_data:
+        return {"status": "error", "message": "Missing required key: `align`"}
+    if len(response_data['align']) < 2:
+        return {"status": "error", "message": "Align does not contain more than 1 part as expected!"}
+    return {"status": "success", "message": "Align completed"}
 
-    parsed = ask_gpt(align_prompt, response_json=True, valid_def=valid_align, log_title='align_subs')
-    
+def apply_align(parsed, src_part: str) -> Tuple[List[str], List[str], str]:
     align_data = parsed['align']
     src_parts = src_part.split('\n')
     tr_parts = [item[f'target_part_{i+1}'].strip() for i, item in enumerate(align_data)]
@@ -75,6 +68,11 @@ def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], Lis
     
     return src_parts, tr_parts, tr_remerged
 
+def align_subs(src_sub: str, tr_sub: str, src_part: str) -> Tuple[List[str], List[str], str]:
+    align_prompt = get_align_prompt(src_sub, tr_sub, src_part)
+    parsed = ask_gpt(align_prompt, response_json=True, valid_def=valid_align, log_title='align_subs')
+    return apply_align(parsed, src_part)
+
 def split_align_subs(src_lines: List[str], tr_lines: List[str]) -> Tuple[List[str], List[str], List[str]]:
     subtitle_set = load_key("subtitle")
     MAX_SUB_LENGTH = subtitle_set["max_length"]
@@ -93,16 +91,16 @@ def split_align_subs(src_lines: List[str], tr_lines: List[str]) -> Tuple[List[st
             table.add_row("Target Line", tr)
             console.print(table)
     
-    def process(i):
-        split_src = split_sentence(src_lines[i], num_parts=2).strip()
-        src_parts, tr_parts, tr_remerged = align_subs(src_lines[i], tr_lines[i], split_src)
+    # Two pooled batches: split every long source line, then align each translation to its split
+    split_srcs = [split.strip() for split in split_sentences_batch([(src_lines[i], 2, 18, -1) for i in to_split])]
+    align_prompts = [get_align_prompt(src_lines[i], tr_lines[i], split_src) for i, split_src in zip(to_split, split_srcs)]
+    aligned = ask_gpt_many(align_prompts, response_json=True, valid_def=valid_align, log_title='align_subs')
+    for i, split_src, parsed in zip(to_split, split_srcs, aligned):
+        src_parts, tr_parts, tr_remerged = apply_align(parsed, split_src)
         src_lines[i] = src_parts
         tr_lines[i] = tr_parts
         remerged_tr_lines[i] = tr_remerged
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
-        executor.map(process, to_split)
-    
     # Flatten `src_lines` and `tr_lines`
     src_lines = [item for sublist in src_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
     tr_lines = [item for sublist in tr_lines for item in (sublist if isinstance(sublist, list) else [sublist])]
@@ -112,7 +110,7 @@ def split_align_subs(src_lines: List[str], tr_lines: List[str]) -> Tuple[List[st
 def split_for_sub_main():
     console.print("[bold green]🚀 Start splitting subtitles...[/bold green]")
     
-    df = pd.read_excel(INPUT_FILE)
+    df = load_table('translation_results')
     src = df['Source'].tolist()
     trans = df['Translation'].tolist()
     
@@ -133,8 +131,8 @@ def split_for_sub_main():
         src = split_src
         trans = split_trans
 
-    pd.DataFrame({'Source': split_src, 'Translation': split_trans}).to_excel(OUTPUT_SPLIT_FILE, index=False)
-    pd.DataFrame({'Source': src, 'Translation': remerged}).to_excel(OUTPUT_REMERGED_FILE, index=False)
+    save_table('translation_results_for_subtitles', pd.DataFrame({'Source': split_src, 'Translation': split_trans}))
+    save_table('translation_results_remerged', pd.DataFrame({'Source': src, 'Translation': remerged}))
 
 if __name__ == '__main__':
     split_for_sub_main()
@@ -2,9 +2,13 @@ import pandas as pd
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import re
+import numpy as np
+from difflib import SequenceMatcher
 from rich.panel import Panel
 from rich.console import Console
 import autocorrect_py as autocorrect
+from core.intermediate_store import load_table, table_file
+from core.transcript_index import TranscriptIndex, load_transcript_index
 
 """
 字幕时间轴优化
@@ -14,10 +18,6 @@ import autocorrect_py as autocorrect
 
 console = Console()
 
-CLEANED_CHUNKS_FILE = 'output/log/cleaned_chunks.xlsx'
-TRANSLATION_RESULTS_FOR_SUBTITLES_FILE = 'output/log/translation_results_for_subtitles.xlsx'
-TRANSLATION_RESULTS_REMERGED_FILE = 'output/log/translation_results_remerged.xlsx'
-
 OUTPUT_DIR = 'output'
 AUDIO_OUTPUT_DIR = 'output/audio'
 
@@ -33,6 +33,9 @@ AUDIO_SUBTITLE_OUTPUT_CONFIGS = [
     ('trans_subs_for_audio.srt', ['Translation'])
 ]
 
+RESYNC_WINDOW = 200  # chars searched ahead of the cursor before giving up on a sentence
+FUZZY_MIN_RATIO = 0.8  # share of a sentence's chars that must match during fuzzy resync
+
 def convert_to_srt_format(start_time, end_time):
     """Convert time (in seconds) to the format: hours:minutes:seconds,milliseconds"""
     def seconds_to_hmsm(seconds):
@@ -69,61 +72,91 @@ def show_difference(str1, str2):
     print("Position markers: " + "".join("^" if i in diff_positions else " " for i in range(max(len(str1), len(str2)))))
     print(f"Difference indices: {diff_positions}")
 
-def get_sentence_timestamps(df_words, df_sentences):
-    time_stamp_list = []
-    
-    # Build complete string and position mapping
-    full_words_str = ''
-    position_to_word_idx = {}
-    
-    for idx, word in enumerate(df_words['text']):
-        clean_word = remove_punctuation(word.lower())
-        start_pos = len(full_words_str)
-        full_words_str += clean_word
-        for pos in range(start_pos, len(full_words_str)):
-            position_to_word_idx[pos] = idx
+class WordAlignment:
+    """Cleaned word stream of the transcript with a char -> word index array, built once and shared"""
+    def __init__(self, df_words):
+        clean_words = [remove_punctuation(str(word).lower()).replace(" ", "") for word in df_words['text']]
+        lengths = np.fromiter((len(w) for w in clean_words), dtype=np.int64, count=len(clean_words))
+        self.text = ''.join(clean_words)
+        self.char_to_word = np.repeat(np.arange(len(clean_words)), lengths)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))  # word i covers text[offsets[i]:offsets[i+1]]
+        self.starts = df_words['start'].to_numpy(dtype=float)
+        self.ends = df_words['end'].to_numpy(dtype=float)
+
+    def word_at(self, pos):
+        return int(self.char_to_word[min(pos, len(self.char_to_word) - 1)])
+
+def _fuzzy_resync(full_words_str, clean_sentence, current_pos):
+    """Best approximate match of the sentence in a bounded window after the cursor, (start, end) or None"""
+    window = full_words_str[current_pos:current_pos + len(clean_sentence) + RESYNC_WINDOW]
+    blocks = [b for b in SequenceMatcher(None, window, clean_sentence, autojunk=False).get_matching_blocks() if b.size]
+    if not blocks or sum(b.size for b in blocks) < FUZZY_MIN_RATIO * len(clean_sentence):
+        return None
+    return current_pos + blocks[0].a, current_pos + blocks[-1].a + blocks[-1].size
+
+def get_sentence_word_spans(df_words, df_sentences, alignment=None):
+    """(first word, last word) index of every sentence in the word table"""
+    alignment = alignment if alignment is not None else WordAlignment(df_words)
+    full_words_str = alignment.text
+    spans = []
     
     current_pos = 0
     for idx, sentence in df_sentences['Source'].items():
         clean_sentence = remove_punctuation(sentence.lower()).replace(" ", "")
         sentence_len = len(clean_sentence)
         
-        match_found = False
-        while current_pos <= len(full_words_str) - sentence_len:
-            if full_words_str[current_pos:current_pos+sentence_len] == clean_sentence:
-                start_word_idx = position_to_word_idx[current_pos]
-                end_word_idx = position_to_word_idx[current_pos + sentence_len - 1]
-                
-                time_stamp_list.append((
-                    float(df_words['start'][start_word_idx]),
-                    float(df_words['end'][end_word_idx])
-                ))
-                
-                current_pos += sentence_len
-                match_found = True
-                break
-            current_pos += 1
-            
-        if not match_found:
-            print(f"\n⚠️ Warning: No exact match found for sentence: {sentence}")
-            show_difference(clean_sentence, 
-                          full_words_str[current_pos:current_pos+len(clean_sentence)])
-            print("\nOriginal sentence:", df_sentences['Source'][idx])
-            raise ValueError("❎ No match found for sentence.")
+        # direct index advance in the common case, then an exact search, then a bounded fuzzy resync
+        if full_words_str.startswith(clean_sentence, current_pos):
+            match_start, match_end = current_pos, current_pos + sentence_len
+        else:
+            found = full_words_str.find(clean_sentence, current_pos)
+            if found != -1:
+                match_start, match_end = found, found + sentence_len
+            else:
+                span = _fuzzy_resync(full_words_str, clean_sentence, current_pos)
+                if span is None:
+                    print(f"\n⚠️ Warning: No exact match found for sentence: {sentence}")
+                    show_difference(clean_sentence, 
+                                  full_words_str[current_pos:current_pos+len(clean_sentence)])
+                    print("\nOriginal sentence:", df_sentences['Source'][idx])
+                    raise ValueError("❎ No match found for sentence.")
+                match_start, match_end = span
+                console.print(f"[yellow]⚠️ Fuzzy matched sentence {idx}: {sentence}[/yellow]")
+        
+        spans.append((alignment.word_at(match_start), alignment.word_at(max(match_start, match_end - 1))))
+        current_pos = match_end
     
-    return time_stamp_list
-
-def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output_dir: str, for_display: bool = True):
-    """Align timestamps and add a new timestamp column to df_translate"""
+    return spans
+
+def get_sentence_timestamps(df_words, df_sentences, alignment=None):
+    alignment = alignment if alignment is not None else WordAlignment(df_words)
+    spans = get_sentence_word_spans(df_words, df_sentences, alignment)
+    return [(float(alignment.starts[first]), float(alignment.ends[last])) for first, last in spans]
+
+_CLEANED_WORDS_CACHE = {}
+
+def load_cleaned_words():
+    """Read the word table and its alignment once, reused until the file changes"""
+    path = table_file('cleaned_chunks')
+    stamp = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    if stamp not in _CLEANED_WORDS_CACHE:
+        df_text = load_table('cleaned_chunks')
+        df_text['text'] = df_text['text'].str.strip()
+        _CLEANED_WORDS_CACHE.clear()
+        _CLEANED_WORDS_CACHE[stamp] = (df_text, WordAlignment(df_text))
+    return _CLEANED_WORDS_CACHE[stamp]
+
+def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output_dir: str, for_display: bool = True, alignment=None, index=None, index_level=None):
+    """
+    Align timestamps and add a new timestamp column to df_translate.
+    With a transcript `index`, the rows are also recorded as its `index_level` ('sentences' or 'subtitles').
+    """
     df_trans_time = df_translate.copy()
 
-    # Assign an ID to each word in df_text['text'] and create a new DataFrame
-    words = df_text['text'].str.split(expand=True).stack().reset_index(level=1, drop=True).reset_index()
-    words.columns = ['id', 'word']
-    words['id'] = words['id'].astype(int)
-
     # Process timestamps ⏰
-    time_stamp_list = get_sentence_timestamps(df_text, df_translate)
+    alignment = alignment if alignment is not None else WordAlignment(df_text)
+    spans = get_sentence_word_spans(df_text, df_translate, alignment)
+    time_stamp_list = [(float(alignment.starts[first]), float(alignment.ends[last])) for first, last in spans]
     df_trans_time['timestamp'] = time_stamp_list
     df_trans_time['duration'] = df_trans_time['timestamp'].apply(lambda x: x[1] - x[0])
 
@@ -133,6 +166,7 @@ def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output
         if 0 < delta_time < 1:
             df_trans_time.at[i, 'timestamp'] = (df_trans_time.loc[i, 'timestamp'][0], df_trans_time.loc[i+1, 'timestamp'][0])
 
+    final_times = df_trans_time['timestamp'].tolist()
     # Convert start and end timestamps to SRT format
     df_trans_time['timestamp'] = df_trans_time['timestamp'].apply(lambda x: convert_to_srt_format(x[0], x[1]))
 
@@ -140,6 +174,10 @@ def align_timestamp(df_text, df_translate, subtitle_output_configs: list, output
     if for_display:
         df_trans_time['Translation'] = df_trans_time['Translation'].apply(lambda x: re.sub(r'[，。]', ' ', x).strip())
 
+    if index is not None:
+        setter = index.set_sentences if index_level == 'sentences' else index.set_subtitles
+        setter(spans, final_times, df_trans_time['Translation'].str.strip(), df_trans_time['Source'].str.strip())
+
     # Output subtitles 📜
     def generate_subtitle_string(df, columns):
         return ''.join([f"{i+1}\n{row['timestamp']}\n{row[columns[0]].strip()}\n{row[columns[1]].strip() if len(columns) > 1 else ''}\n\n" for i, row in df.iterrows()]).strip()
@@ -161,20 +199,24 @@ def clean_translation(x):
     return autocorrect.format(cleaned)
 
 def align_timestamp_main():
-    df_text = pd.read_excel(CLEANED_CHUNKS_FILE)
-    df_text['text'] = df_text['text'].str.strip('"').str.strip()
-    df_translate = pd.read_excel(TRANSLATION_RESULTS_FOR_SUBTITLES_FILE)
+    df_text, alignment = load_cleaned_words()
+    index = load_transcript_index()
+    if index is None or len(index.words) != len(df_text):
+        index = TranscriptIndex.from_words(df_text)
+    df_translate = load_table('translation_results_for_subtitles')
     df_translate['Translation'] = df_translate['Translation'].apply(clean_translation)
     
-    align_timestamp(df_text, df_translate, SUBTITLE_OUTPUT_CONFIGS, OUTPUT_DIR)
+    align_timestamp(df_text, df_translate, SUBTITLE_OUTPUT_CONFIGS, OUTPUT_DIR, alignment=alignment, index=index, index_level='subtitles')
     console.print(Panel("[bold green]🎉📝 Subtitles generation completed! Please check in the `output` folder 👀[/bold green]"))
 
     # for audio
-    df_translate_for_audio = pd.read_excel(TRANSLATION_RESULTS_REMERGED_FILE) # use remerged file to avoid unmatched lines when dubbing
+    df_translate_for_audio = load_table('translation_results_remerged') # use remerged file to avoid unmatched lines when dubbing
     df_translate_for_audio['Translation'] = df_translate_for_audio['Translation'].apply(clean_translation)
     
-    align_timestamp(df_text, df_translate_for_audio, AUDIO_SUBTITLE_OUTPUT_CONFIGS, AUDIO_OUTPUT_DIR)
+    align_timestamp(df_text, df_translate_for_audio, AUDIO_SUBTITLE_OUTPUT_CONFIGS, AUDIO_OUTPUT_DIR, alignment=alignment, index=index, index_level='sentences')
     console.print(Panel("[bold green]🎉📝 Audio subtitles generation completed! Please check in the `output/audio` folder 👀[/bold green]"))
+    # sentence / subtitle time ranges for the dubbing steps
+    index.save()
     
 
 if __name__ == '__main__':
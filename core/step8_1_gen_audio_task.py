@@ -9,6 +9,7 @@ from rich import print as rprint
 from rich.panel import Panel
 from rich.console import Console
 from core.config_utils import load_key  
+from core.intermediate_store import save_table, table_exists, table_file
 from core.all_tts_functions.estimate_duration import init_estimator, estimate_duration
 
 """
@@ -24,7 +25,6 @@ speed_factor = load_key("speed_factor")
 
 TRANS_SUBS_FOR_AUDIO_FILE = 'output/audio/trans_subs_for_audio.srt'
 SRC_SUBS_FOR_AUDIO_FILE = 'output/audio/src_subs_for_audio.srt'
-SOVITS_TASKS_FILE = 'output/audio/tts_tasks.xlsx'
 ESTIMATOR = None
 
 def check_len_then_trim(text, duration):
@@ -145,14 +145,14 @@ def process_srt():
     return df
 
 def gen_audio_task_main():
-    if os.path.exists(SOVITS_TASKS_FILE):
-        rprint(Panel(f"{SOVITS_TASKS_FILE} already exists, skip.", title="Info", border_style="blue"))
+    if table_exists('tts_tasks'):
+        rprint(Panel(f"{table_file('tts_tasks')} already exists, skip.", title="Info", border_style="blue"))
     else:
         df = process_srt()
         console.print(df)
-        df.to_excel(SOVITS_TASKS_FILE, index=False)
+        save_table('tts_tasks', df)
 
-        rprint(Panel(f"Successfully generated {SOVITS_TASKS_FILE}", title="Success", border_style="green"))
+        rprint(Panel(f"Successfully generated {table_file('tts_tasks')}", title="Success", border_style="green"))
 
 if __name__ == '__main__':
     gen_audio_task_main()
\ No newline at end of file
@@ -2,7 +2,9 @@ import pandas as pd
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.config_utils import load_key
-from core.all_whisper_methods.audio_preprocess import get_audio_duration
+from core.intermediate_store import load_table, save_table
+from core.transcript_index import load_transcript_index
+from core.all_whisper_methods.audio_preprocess import get_audio_duration, load_silence_map
 from core.step8_1_gen_audio_task import time_diff_seconds
 import datetime
 import re
@@ -19,8 +21,6 @@ step9_extract_refer_audio.py：提取参考音频（可能用于声音克隆）
 """
 
 
-INPUT_EXCEL = "output/audio/tts_tasks.xlsx"
-OUTPUT_EXCEL = "output/audio/tts_tasks.xlsx"
 SRC_SRT = "output/src.srt"
 TRANS_SRT = "output/trans.srt"
 MAX_MERGE_COUNT = 5
@@ -76,7 +76,8 @@ def analyze_subtitle_timing_and_speed(df):
     if ESTIMATOR is None:
         ESTIMATOR = init_estimator()
     TOLERANCE = load_key("tolerance")
-    whole_dur = get_audio_duration(AUDIO_FILE)
+    silence_map = load_silence_map()  # saved by split_audio, avoids another ffmpeg probe
+    whole_dur = silence_map["duration"] if silence_map else get_audio_duration(AUDIO_FILE)
     df['gap'] = 0.0  # Initialize gap column
     for i in range(len(df) - 1):
         current_end = datetime.datetime.strptime(df.loc[i, 'end_time'], '%H:%M:%S.%f').time()
@@ -144,9 +145,27 @@ def process_cutoffs(df):
     
     return df
 
+def clean_srt_text(text):
+    return re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
+
+def read_srt_lines(srt_file):
+    """Text of every subtitle block, parentheses and dashes removed"""
+    with open(srt_file, "r", encoding="utf-8") as f:
+        content = f.read()
+    lines_out = []
+    for block in content.strip().split('\n\n'):
+        lines = [line.strip() for line in block.split('\n') if line.strip()]
+        if len(lines) >= 3:
+            lines_out.append(clean_srt_text(' '.join(lines[2:])))
+    return lines_out
+
+def srt_time_to_seconds(time_str):
+    hours, minutes, seconds = time_str.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
 def gen_dub_chunks():
     rprint("[🎬 Starting] Generating dubbing chunks...")
-    df = pd.read_excel(INPUT_EXCEL)
+    df = load_table('tts_tasks')
     
     rprint("[📊 Processing] Analyzing timing and speed...")
     df = analyze_subtitle_timing_and_speed(df)
@@ -154,33 +173,18 @@ def gen_dub_chunks():
     rprint("[✂️ Processing] Processing cutoffs...")
     df = process_cutoffs(df)
 
-    rprint("[📝 Reading] Loading transcript files...")
-    content = open(TRANS_SRT, "r", encoding="utf-8").read()
-    ori_content = open(SRC_SRT, "r", encoding="utf-8").read()
-    
-    # Process subtitle content
-    content_lines = []
-    ori_content_lines = []
-    
-    # Process translated subtitles
-    for block in content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) >= 3:
-            text = ' '.join(lines[2:])
-            text = re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
-            content_lines.append(text)
-            
-    # Process source subtitles (same structure)
-    for block in ori_content.strip().split('\n\n'):
-        lines = [line.strip() for line in block.split('\n') if line.strip()]
-        if len(lines) >= 3:
-            text = ' '.join(lines[2:])
-            text = re.sub(r'\([^)]*\)|（[^）]*）', '', text).strip().replace('-', '')
-            ori_content_lines.append(text)
-
     # Match processing
     df['lines'] = None
     df['src_lines'] = None
+    index = load_transcript_index()
+    if index is not None and index.subtitles is not None:
+        rprint("[📝 Reading] Matching subtitle lines from the transcript index...")
+        content_lines = [clean_srt_text(text) for text in index.subtitles.text]
+        ori_content_lines = [clean_srt_text(text) for text in index.subtitles.src]
+    else:
+        rprint("[📝 Reading] Loading transcript files...")
+        content_lines = read_srt_lines(TRANS_SRT)
+        ori_content_lines = read_srt_lines(SRC_SRT)
     last_idx = 0
 
     def clean_text(text):
@@ -189,23 +193,29 @@ def gen_dub_chunks():
             return ''
         return re.sub(r'[^\w\s]|[\s]', '', text)
 
+    def accept(idx, match_indices):
+        nonlocal last_idx
+        df.at[idx, 'lines'] = [content_lines[i] for i in match_indices]
+        df.at[idx, 'src_lines'] = [ori_content_lines[i] for i in match_indices]
+        last_idx = match_indices[-1] + 1
+
     for idx, row in df.iterrows():
         target = clean_text(row['text'])
-        matches = []
+        # subtitles centred in this task's time range, O(log n); verified against the text before use
+        if index is not None and index.subtitles is not None:
+            candidates = [i for i in index.subtitles.centered_in(srt_time_to_seconds(row['start_time']), srt_time_to_seconds(row['end_time'])) if i >= last_idx]
+            if candidates and candidates[0] == last_idx and ''.join(clean_text(content_lines[i]) for i in candidates) == target:
+                accept(idx, candidates)
+                continue
+
         current = ''
         match_indices = []  # Store indices for matching lines
-        
         for i in range(last_idx, len(content_lines)):
-            line = content_lines[i]
-            cleaned_line = clean_text(line)
-            current += cleaned_line
-            matches.append(line)  # 存储原始文本
+            current += clean_text(content_lines[i])
             match_indices.append(i)
             
             if current == target:
-                df.at[idx, 'lines'] = matches
-                df.at[idx, 'src_lines'] = [ori_content_lines[i] for i in match_indices]
-                last_idx = i + 1
+                accept(idx, match_indices)
                 break
         else:  # If no match is found
             rprint(f"[❌ Error] Matching failed at line {idx}:")
@@ -214,7 +224,7 @@ def gen_dub_chunks():
             raise ValueError("Matching failed")
 
     # Save results
-    df.to_excel(OUTPUT_EXCEL, index=False)
+    save_table('tts_tasks', df)
     rprint("[✅ Complete] Matching completed successfully!")
 
 if __name__ == "__main__":
@@ -4,10 +4,10 @@ from rich import print as rprint
 from rich.panel import Panel
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
-import pandas as pd
 import soundfile as sf
 console = Console()
 from core.all_whisper_methods.demucs_vl import demucs_main, VOCAL_AUDIO_FILE
+from core.intermediate_store import load_table
 
 """
 音频生成
@@ -20,7 +20,6 @@ step9_extract_refer_audio.py：提取参考音频（可能用于声音克隆）
 # Simplified path definitions
 REF_DIR = 'output/audio/refers'
 SEG_DIR = 'output/audio/segs'
-TASKS_FILE = 'output/audio/tts_tasks.xlsx'
 
 def time_to_samples(time_str, sr):
     """Unified time conversion function"""
@@ -45,7 +44,7 @@ def extract_refer_audio_main():
     os.makedirs(REF_DIR, exist_ok=True)
     
     # Read task file and audio data
-    df = pd.read_excel(TASKS_FILE)
+    df = load_table('tts_tasks')
     data, sr = sf.read(VOCAL_AUDIO_FILE)
     
     with Progress(
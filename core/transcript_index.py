@@ -0,0 +1,106 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from typing import List, Tuple
+
+"""
+转录时间索引：单词 / 句子 / 字幕三级，按时间有序的 start/end 数组，二分查找区间。
+    ASR 后建立单词级，step6 对齐时间轴后补充句子级和字幕级，以及 单词→句子、句子→字幕 映射。
+    保存为 output/log/transcript_index.npz，后续步骤直接按时间区间 O(log n) 查询，不再重新解析 SRT / 表格线性扫描。
+"""
+
+INDEX_FILE = "output/log/transcript_index.npz"
+
+class Intervals:
+    """Spans in transcript order; running maxima keep binary search valid when whisper timestamps slightly overlap"""
+    def __init__(self, starts, ends, text, src=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.text = np.asarray(text, dtype=str)
+        self.src = None if src is None else np.asarray(src, dtype=str)
+        self._max_starts = np.maximum.accumulate(self.starts) if len(self.starts) else self.starts
+        self._max_ends = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def between(self, t0: float, t1: float) -> range:
+        """Indices of spans overlapping [t0, t1)"""
+        first = int(np.searchsorted(self._max_ends, t0, side='right'))
+        last = int(np.searchsorted(self._max_starts, t1, side='left'))
+        return range(first, max(first, last))
+
+    def centered_in(self, t0: float, t1: float) -> List[int]:
+        """Indices of spans whose midpoint lies in [t0, t1]"""
+        return [i for i in self.between(t0, t1) if t0 <= (self.starts[i] + self.ends[i]) / 2 <= t1]
+
+class TranscriptIndex:
+    def __init__(self, words: Intervals):
+        self.words = words
+        self.sentences = None
+        self.subtitles = None
+        self.word_to_sentence = None
+        self.sentence_to_subtitles = None  # (n_sentences, 2): first and one-past-last subtitle of each sentence
+
+    @classmethod
+    def from_words(cls, df_words):
+        return cls(Intervals(df_words['start'], df_words['end'], df_words['text'].astype(str)))
+
+    def set_sentences(self, spans: List[Tuple[int, int]], times: List[Tuple[float, float]], text, src):
+        """`spans` are (first word, last word) per sentence, `times` the final sentence timestamps"""
+        self.sentences = Intervals([t[0] for t in times], [t[1] for t in times], text, src)
+        firsts = np.array([span[0] for span in spans], dtype=np.int64)
+        # each word belongs to the last sentence starting at or before it
+        self.word_to_sentence = np.clip(np.searchsorted(firsts, np.arange(len(self.words)), side='right') - 1, 0, None)
+        self._link_subtitles()
+
+    def set_subtitles(self, spans: List[Tuple[int, int]], times: List[Tuple[float, float]], text, src):
+        self.subtitles = Intervals([t[0] for t in times], [t[1] for t in times], text, src)
+        self._subtitle_first_words = np.array([span[0] for span in spans], dtype=np.int64)
+        self._link_subtitles()
+
+    def _link_subtitles(self):
+        if self.sentences is None or self.subtitles is None:
+            return
+        subtitle_sentence = self.word_to_sentence[self._subtitle_first_words]
+        sentence_ids = np.arange(len(self.sentences))
+        self.sentence_to_subtitles = np.stack([
+            np.searchsorted(subtitle_sentence, sentence_ids, side='left'),
+            np.searchsorted(subtitle_sentence, sentence_ids, side='right'),
+        ], axis=1)
+
+    def subtitles_of_sentence(self, sentence: int) -> range:
+        first, last = self.sentence_to_subtitles[sentence]
+        return range(int(first), int(last))
+
+    def save(self, path: str = INDEX_FILE):
+        arrays = {'word_start': self.words.starts, 'word_end': self.words.ends, 'word_text': self.words.text}
+        if self.sentences is not None:
+            arrays.update(sentence_start=self.sentences.starts, sentence_end=self.sentences.ends,
+                          sentence_text=self.sentences.text, sentence_src=self.sentences.src,
+                          word_to_sentence=self.word_to_sentence)
+        if self.subtitles is not None:
+            arrays.update(subtitle_start=self.subtitles.starts, subtitle_end=self.subtitles.ends,
+                          subtitle_text=self.subtitles.text, subtitle_src=self.subtitles.src,
+                          subtitle_first_word=self._subtitle_first_words)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = INDEX_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(Intervals(data['word_start'], data['word_end'], data['word_text']))
+            if 'sentence_start' in data:
+                index.sentences = Intervals(data['sentence_start'], data['sentence_end'], data['sentence_text'], data['sentence_src'])
+                index.word_to_sentence = data['word_to_sentence']
+            if 'subtitle_start' in data:
+                index.subtitles = Intervals(data['subtitle_start'], data['subtitle_end'], data['subtitle_text'], data['subtitle_src'])
+                index._subtitle_first_words = data['subtitle_first_word']
+        index._link_subtitles()
+        return index
+
+def load_transcript_index(path: str = INDEX_FILE):
+    """The saved index, or None when it was never built"""
+    return TranscriptIndex.load(path) if os.path.exists(path) else None
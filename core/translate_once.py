@@ -88,7 +88,7 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
     translate_result = "\n".join([express_result[i]["free"].replace('\n', ' ').strip() for i in express_result])
 
     if len(lines.split('\n')) != len(translate_result.split('\n')):
-        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.json`[/red]'))
+        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please run `python core/gpt_cache.py translate_expressiveness` and check the exported log[/red]'))
         raise ValueError(f'Origin ···{lines}···,\nbut got ···{translate_result}···')
 
     return translate_result, lines
@@ -2,6 +2,7 @@ import streamlit as st
 import os, sys
 from st_components.imports_and_utils import *
 from core.config_utils import load_key
+from core.llm_scheduler import report_usage
 
 # SET PATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -58,6 +59,8 @@ def process_text():
         step6_generate_final_timeline.align_timestamp_main()
     with st.spinner(t("Merging subtitles to video...")):
         step7_merge_sub_to_vid.merge_subtitles_to_video()
+    # per-video totals, the next run starts from a fresh scheduler
+    report_usage(reset=True)
     
     st.success(t("Subtitle processing complete! 🎉"))
     st.balloons()
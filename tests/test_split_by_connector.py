@@ -0,0 +1,57 @@
+import os, sys, json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from core.spacy_utils.split_by_connector import split_by_connectors
+
+"""
+对照黄金样例检查单遍连接词拆分：样例是改写前按轮切分、逐轮重扫的实现在同样句法标注上的输出。
+    标注（词、词性、依存、中心词）直接记录在 fixture 中，测试不需要加载 spaCy 模型。
+"""
+
+GOLDEN_FILE = os.path.join(os.path.dirname(__file__), "fixtures", "connector_golden.json")
+
+class Token:
+    def __init__(self, doc, i, text, pos, dep, head):
+        self.doc, self.i, self.text, self.pos_, self.dep_, self._head = doc, i, text, pos, dep, head
+        self.is_punct = pos == "PUNCT"
+
+    @property
+    def head(self):
+        return self.doc.tokens[self._head]
+
+class Span:
+    def __init__(self, doc, start, end):
+        self.doc, self.start, self.end = doc, start, end
+
+    def __iter__(self):
+        return iter(self.doc.tokens[self.start:self.end])
+
+    def __len__(self):
+        return self.end - self.start
+
+class Doc:
+    """The parts of a spaCy Doc the splitter reads, built from recorded annotations"""
+    def __init__(self, lang, tokens):
+        self.lang_ = lang
+        self.tokens = [Token(self, i, *token) for i, token in enumerate(tokens)]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, _ = key.indices(len(self.tokens))
+            return Span(self, start, max(start, end))
+        return self.tokens[key]
+
+def load_cases():
+    with open(GOLDEN_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+@pytest.mark.parametrize("case", load_cases(), ids=lambda case: case["name"])
+def test_single_pass_matches_golden(case):
+    doc = Doc(case["lang"], case["tokens"])
+    start, end = case.get("span", [0, len(doc)])
+    for context_words, expected in case["expected"].items():
+        pieces = split_by_connectors(doc[start:end], context_words=int(context_words))
+        assert [[piece.start, piece.end] for piece in pieces] == expected, f"context_words={context_words}"